@@ -0,0 +1,128 @@
+''' End to end crawl throughput against a replayed crawl, for each THREADCOUNT.
+
+First record a crawl by setting RECORD in config.ini, then
+
+    python3 -m benchmarks.crawl_benchmark crawl.archive --threads 1,4,8,16
+
+Each run starts from an empty frontier in a scratch folder and crawls the
+archive through utils.cache_server with the given latency, so runs see the
+same pages and can be compared. Every crawl runs in its own process and
+reports pages/sec, CPU time per page and peak resident memory.
+'''
+import os
+import sys
+import json
+import time
+import socket
+import resource
+import tempfile
+import subprocess
+
+from argparse import ArgumentParser
+from configparser import ConfigParser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Replay server did not start on port {port}.")
+
+
+def write_config(folder, threads, politeness):
+    cparser = ConfigParser()
+    cparser.read(os.path.join(ROOT, "config.ini"))
+    cparser["LOCAL PROPERTIES"]["THREADCOUNT"] = str(threads)
+    cparser["LOCAL PROPERTIES"]["SAVE"] = os.path.join(folder, "frontier.shelve")
+    cparser["LOCAL PROPERTIES"]["METRICSPORT"] = "0"
+    cparser["LOCAL PROPERTIES"]["METRICSFILE"] = os.path.join(folder, "metrics.json")
+    cparser["LOCAL PROPERTIES"]["RECORD"] = ""
+    cparser["CRAWLER"]["POLITENESS"] = str(politeness)
+    config_file = os.path.join(folder, "config.ini")
+    with open(config_file, "w") as f:
+        cparser.write(f)
+    return config_file
+
+
+def run_child(config_file, engine, port, usage_file):
+    ''' Runs one crawl in this process and saves its resource usage. '''
+    sys.path.insert(0, ROOT)
+    import launch
+    launch.main(config_file, True, engine, f"127.0.0.1:{port}")
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    with open(usage_file, "w") as f:
+        json.dump({
+            "cpu_seconds": usage.ru_utime + usage.ru_stime,
+            # ru_maxrss is in KiB on Linux and bytes on macOS.
+            "max_rss_mb": usage.ru_maxrss / (1024 ** 2 if sys.platform == "darwin" else 1024)}, f)
+
+
+def bench(threads, engine, port, politeness):
+    with tempfile.TemporaryDirectory() as folder:
+        config_file = write_config(folder, threads, politeness)
+        usage_file = os.path.join(folder, "usage.json")
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child",
+             config_file, "--engine", engine, "--port", str(port),
+             "--usage_file", usage_file],
+            cwd=folder, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            check=True)
+        elapsed = time.perf_counter() - start
+        with open(os.path.join(folder, "metrics.json")) as f:
+            pages = int(json.load(f)["pages"])
+        with open(usage_file) as f:
+            usage = json.load(f)
+    return pages, elapsed, usage
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("archive", nargs="?", default=None)
+    parser.add_argument("--threads", type=str, default="1,2,4,8,16")
+    parser.add_argument("--engine", choices=["threads", "async"], default="threads")
+    parser.add_argument(
+        "--latency", type=float, default=0.05,
+        help="Seconds the replay server waits before each answer.")
+    parser.add_argument("--politeness", type=float, default=0.0)
+    # Internal: how bench() runs each crawl in its own process.
+    parser.add_argument("--child", type=str, default=None)
+    parser.add_argument("--port", type=int, default=None)
+    parser.add_argument("--usage_file", type=str, default=None)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.engine, args.port, args.usage_file)
+        sys.exit(0)
+    if not args.archive:
+        parser.error("the archive to replay is required")
+
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "utils.cache_server", "--port", str(port),
+         "--latency", str(args.latency), "--replay", os.path.abspath(args.archive)],
+        cwd=ROOT, stdout=subprocess.DEVNULL)
+    try:
+        wait_for_port(port)
+        print(f"{'threads':>8} {'pages':>7} {'seconds':>8} {'pages/sec':>10} "
+              f"{'cpu ms/page':>12} {'peak rss MB':>12}")
+        for threads in map(int, args.threads.split(",")):
+            pages, elapsed, usage = bench(threads, args.engine, port, args.politeness)
+            cpu = usage["cpu_seconds"] * 1000 / max(pages, 1)
+            print(f"{threads:>8} {pages:>7} {elapsed:>8.2f} {pages / elapsed:>10.1f} "
+                  f"{cpu:>12.2f} {usage['max_rss_mb']:>12.1f}")
+    finally:
+        server.terminate()
+        server.wait()
@@ -0,0 +1,71 @@
+''' Pages per second for each HTML parser backend in utils/parsing.py.
+
+    python3 -m benchmarks.parse_benchmark path/to/pages
+
+The folder is walked for saved pages: either .json files in the DEV format
+({"url": ..., "content": ...}) or raw .html/.htm files. Without a folder,
+pages from utils.cache_server.SyntheticSite are used.
+'''
+import os
+import json
+import time
+
+from argparse import ArgumentParser
+from bs4 import BeautifulSoup
+
+from utils.parsing import PARSERS
+from utils.cache_server import SyntheticSite
+
+
+def load_pages(path, limit):
+    pages = list()
+    for subdir, dirs, files in os.walk(path):
+        for name in files:
+            file_path = os.path.join(subdir, name)
+            if name.endswith(".json"):
+                with open(file_path, "r") as f:
+                    pages.append(json.load(f)["content"].encode("utf-8"))
+            elif name.endswith((".html", ".htm")):
+                with open(file_path, "rb") as f:
+                    pages.append(f.read())
+            if len(pages) >= limit:
+                return pages
+    return pages
+
+
+def synthetic_pages(limit):
+    site = SyntheticSite(["www.ics.uci.edu"], pages_per_host=limit)
+    return [site.get(f"https://www.ics.uci.edu/page/{page}")[1] for page in range(limit)]
+
+
+def parse_twice(content):
+    ''' What the scraper did before: one tree for links, one for text. '''
+    hrefs = [a.attrs.get("href") for a in BeautifulSoup(content, "html.parser").find_all("a")]
+    return hrefs, BeautifulSoup(content, "html.parser").text
+
+
+def bench(parse, pages, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for content in pages:
+            parse(content)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(pages) / best
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("path", nargs="?", default=None)
+    parser.add_argument("--limit", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    pages = load_pages(args.path, args.limit) if args.path else synthetic_pages(args.limit)
+    size = sum(len(content) for content in pages) / max(len(pages), 1)
+    print(f"{len(pages)} pages, {size / 1024:.1f} KiB on average, best of {args.repeat}")
+    backends = [("html.parser twice (old scraper)", parse_twice)]
+    backends.extend(sorted(PARSERS.items()))
+    for name, parse in backends:
+        print(f"{name:>32}: {bench(parse, pages, args.repeat):8.1f} pages/sec")
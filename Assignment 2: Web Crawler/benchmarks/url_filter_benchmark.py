@@ -0,0 +1,106 @@
+''' Urls per second for the compiled url filter against the old is_valid rules.
+
+    python3 -m benchmarks.url_filter_benchmark hrefs.txt
+    python3 -m benchmarks.url_filter_benchmark --pages path/to/pages
+
+hrefs.txt holds one href per line, e.g. dumped from a crawl log. With
+--pages, the hrefs are extracted from saved pages (see parse_benchmark).
+Without either, a synthetic mix of in and out of scope hrefs is used.
+Urls the two disagree on are counted and a few are printed.
+'''
+import re
+import time
+import random
+
+from argparse import ArgumentParser
+from urllib.parse import urlparse
+
+from benchmarks.parse_benchmark import load_pages
+from utils.parsing import get_parser
+import scraper
+
+
+def legacy_allows(url):
+    ''' The rules as is_valid applied them before utils/url_filter.py. '''
+    if len(url) > 150:
+        return False
+    parsed = urlparse(url)
+    if parsed.scheme not in set(["http", "https"]):
+        return False
+    query_bl = {"replytocom", "share", "page_id", "afg", "ical", "action"}
+    if any([(query in parsed.query) for query in query_bl]):
+        return False
+    domain_wl = ["ics.uci.edu", "cs.uci.edu", "informatics.uci.edu", "stat.uci.edu", "today.uci.edu/department/information_computer_sciences"]
+    if not any([(domain in parsed.netloc) for domain in domain_wl]):
+        return False
+    if "eecs.uci.edu" in parsed.netloc:
+        return False
+    path_bl = {"/events/", "/day/", "/week/", "/month/", "/list/", "?filter"}
+    if any([(path in url.lower()) for path in path_bl]):
+        return False
+    if re.match(
+        r".*\.(css|js|bmp|gif|jpe?g|ico"
+        + r"|png|tiff?|mid|mp2|mp3|mp4"
+        + r"|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf"
+        + r"|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names"
+        + r"|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso"
+        + r"|epub|dll|cnf|tgz|sha1"
+        + r"|thmx|mso|arff|rtf|jar|csv"
+        + r"|rm|smil|wmv|swf|wma|zip|rar|gz)$", parsed.path.lower()):
+        return False
+    return True
+
+
+def synthetic_hrefs(count):
+    rand = random.Random(0)
+    hosts = ["www.ics.uci.edu", "vision.ics.uci.edu", "www.cs.uci.edu", "www.stat.uci.edu",
+        "www.informatics.uci.edu", "www.eecs.uci.edu", "www.uci.edu", "github.com",
+        "today.uci.edu", "www.youtube.com"]
+    paths = ["/", "/about", "/people/faculty", "/events/2020/01", "/pub/paper.pdf",
+        "/~user/index.html", "/wiki/doku.php", "/img/logo.png", "/department/information_computer_sciences/x"]
+    queries = ["", "", "", "?id=3", "?replytocom=12", "?share=twitter", "?page=2"]
+    return [
+        f"{rand.choice(['https', 'http', 'mailto'])}://{rand.choice(hosts)}"
+        f"{rand.choice(paths)}{rand.choice(queries)}"
+        for _ in range(count)]
+
+
+def bench(allows, hrefs, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for href in hrefs:
+            allows(href)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(hrefs) / best
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("hrefs", nargs="?", default=None)
+    parser.add_argument("--pages", type=str, default=None)
+    parser.add_argument("--limit", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.hrefs:
+        with open(args.hrefs, "r") as f:
+            hrefs = [line.strip() for line in f if line.strip()][:args.limit]
+    elif args.pages:
+        parse_page = get_parser()
+        hrefs = [
+            href for content in load_pages(args.pages, args.limit)
+            for href in parse_page(content).hrefs if href][:args.limit]
+    else:
+        hrefs = synthetic_hrefs(args.limit)
+    # is_valid defragments before filtering, so do the same here.
+    hrefs = [href.split("#", 1)[0] for href in hrefs]
+
+    print(f"{len(hrefs)} hrefs, best of {args.repeat}")
+    print(f"{'old is_valid rules':>20}: {bench(legacy_allows, hrefs, args.repeat):12.1f} urls/sec")
+    print(f"{'UrlFilter':>20}: {bench(scraper.url_filter.allows, hrefs, args.repeat):12.1f} urls/sec")
+    differ = [href for href in hrefs if legacy_allows(href) != scraper.url_filter.allows(href)]
+    print(f"{len(differ)} hrefs judged differently, e.g.:")
+    for href in sorted(set(differ))[:10]:
+        print(f"    {href} old={legacy_allows(href)} new={scraper.url_filter.allows(href)}")
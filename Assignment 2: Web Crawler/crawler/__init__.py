@@ -1,14 +1,22 @@
-from utils import get_logger
+from utils import get_logger, configure_logging
+from utils.metrics import metrics, start_exporters
 from crawler.frontier import Frontier
 from crawler.worker import Worker
+from crawler.indexing import start_indexing
+import scraper
 
 class Crawler(object):
     def __init__(self, config, restart, frontier_factory=Frontier, worker_factory=Worker):
         self.config = config
+        configure_logging(config)
         self.logger = get_logger("CRAWLER")
         self.frontier = frontier_factory(config, restart)
+        self.indexing = start_indexing(config, self.frontier)
+        scraper.configure(
+            config, self.frontier, self.indexing.submit if self.indexing else None)
         self.workers = list()
         self.worker_factory = worker_factory
+        start_exporters(config)
 
     def start_async(self):
         self.workers = [
@@ -22,5 +30,14 @@ class Crawler(object):
         self.join()
 
     def join(self):
-        for worker in self.workers:
-            worker.join()
+        try:
+            for worker in self.workers:
+                worker.join()
+        finally:
+            # Compact the frontier log so nothing buffered is lost.
+            self.frontier.close()
+            if self.indexing:
+                self.indexing.close()
+            scraper.get_analytics()
+            if self.config.metrics_file:
+                metrics.write_snapshot(self.config.metrics_file)
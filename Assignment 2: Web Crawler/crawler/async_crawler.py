@@ -0,0 +1,117 @@
+import time
+import asyncio
+import aiohttp
+
+from concurrent.futures import ThreadPoolExecutor
+from queue import Empty
+
+from utils import get_logger, configure_logging
+from utils.metrics import metrics, start_exporters
+from utils.async_download import download_async
+from crawler.frontier import Frontier
+from crawler.indexing import start_indexing
+from crawler.worker import RETRY_STATUSES
+import scraper
+
+
+class AsyncCrawler(object):
+    ''' Runs every download on one event loop instead of one thread per
+    Worker. At most ASYNCCONCURRENCY downloads are in flight at once, and the
+    frontier still hands out one url per host at a time. Parsing and
+    scraping run on a small thread pool so they never block the loop. '''
+
+    def __init__(self, config, restart, frontier_factory=Frontier):
+        self.config = config
+        configure_logging(config)
+        self.logger = get_logger("CRAWLER")
+        self.frontier = frontier_factory(config, restart)
+        self.indexing = start_indexing(config, self.frontier)
+        scraper.configure(
+            config, self.frontier, self.indexing.submit if self.indexing else None)
+        # Runs scraper.scraper and the frontier bookkeeping for each page.
+        # Threads rather than processes, because the scraper keeps its
+        # analytics in module level state.
+        self.executor = ThreadPoolExecutor(max_workers=config.parser_threads)
+        # get_tbd_url blocks until a host is ready, so it gets its own thread.
+        self.dispatcher = ThreadPoolExecutor(max_workers=1)
+        start_exporters(config)
+
+    def start(self):
+        try:
+            asyncio.run(self._crawl())
+        finally:
+            self.dispatcher.shutdown()
+            self.executor.shutdown()
+            self.frontier.close()
+            if self.indexing:
+                self.indexing.close()
+            scraper.get_analytics()
+            if self.config.metrics_file:
+                metrics.write_snapshot(self.config.metrics_file)
+
+    async def _crawl(self):
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.config.async_concurrency)
+        tasks = set()
+        connector = aiohttp.TCPConnector(limit=self.config.async_concurrency)
+        timeout = aiohttp.ClientTimeout(
+            sock_connect=self.config.connect_timeout,
+            sock_read=self.config.read_timeout)
+        async with aiohttp.ClientSession(
+                connector=connector, timeout=timeout) as session:
+            while True:
+                await semaphore.acquire()
+                try:
+                    tbd_url = await loop.run_in_executor(
+                        self.dispatcher, self.frontier.get_tbd_url, 1)
+                except Empty:
+                    # Nothing ready yet; check again, still holding no slot.
+                    semaphore.release()
+                    continue
+                if not tbd_url:
+                    semaphore.release()
+                    self.logger.info("Frontier is empty. Stopping Crawler.")
+                    break
+                task = asyncio.create_task(
+                    self._fetch(session, semaphore, tbd_url))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks)
+
+    async def _fetch(self, session, semaphore, tbd_url):
+        loop = asyncio.get_running_loop()
+        resp = None
+        start = time.perf_counter()
+        try:
+            resp = await download_async(
+                session, tbd_url, self.config, self.logger)
+            # observe waits on the frontier lock, which a compaction holds
+            # while it writes the save file; keep that off the loop.
+            await loop.run_in_executor(
+                self.executor, self.frontier.observe,
+                tbd_url, resp.status, time.perf_counter() - start,
+                resp.retry_after if resp.status in RETRY_STATUSES else None)
+            self.logger.info(
+                f"Downloaded {tbd_url}, status <{resp.status}>, "
+                f"using cache {self.config.cache_server}.",
+                extra={"sample": True})
+        except Exception:
+            self.logger.exception(f"Failed to download {tbd_url}.")
+        finally:
+            await loop.run_in_executor(
+                self.executor, self._scrape, tbd_url, resp)
+            semaphore.release()
+            metrics.inc("crawler_pages_total")
+            metrics.observe("page", time.perf_counter() - start)
+
+    def _scrape(self, tbd_url, resp):
+        try:
+            if resp is not None:
+                scraped_urls = scraper.scraper(tbd_url, resp)
+                with metrics.timer("frontier_add"):
+                    for scraped_url in scraped_urls:
+                        self.frontier.add_url(scraped_url, tbd_url)
+        except Exception:
+            self.logger.exception(f"Failed to scrape {tbd_url}.")
+        finally:
+            self.frontier.mark_url_complete(tbd_url)
@@ -1,17 +1,84 @@
 import os
+import json
 import shelve
+import time
+import heapq
+import itertools
 
-from threading import Thread, RLock
+from threading import Thread, RLock, Condition
 from queue import Queue, Empty
+from collections import defaultdict
+from urllib.parse import urlparse
 
-from utils import get_logger, get_urlhash, normalize
+from utils import get_logger, get_urldigest, normalize
+from utils.seen import SeenSet
+from utils.fingerprint import FingerprintIndex
+from utils.traps import TrapDetector
+from utils.metrics import metrics
+from crawler.priority import get_scorer
+from crawler.rate_control import RateController
 from scraper import is_valid
 
 class Frontier(object):
+    # Set of every url ever added. Override to trade memory for exactness.
+    seen_factory = SeenSet
+    # Longest a worker waits before checking _finished again, None for no
+    # limit. Needed when other processes can finish the crawl.
+    poll_interval = None
+
     def __init__(self, config, restart):
         self.logger = get_logger("FRONTIER")
         self.config = config
-        self.to_be_downloaded = list()
+        self.score = get_scorer(config.priority)
+        # Delay and concurrency of each host, adapted to its responses.
+        self.rates = RateController(config)
+        # { url::str -> (depth::int, inlinks::int, seq::int) } for every url
+        # waiting to be downloaded. seq identifies its live heap entry.
+        self.pending = dict()
+        # { netloc::str -> [(score::float, seq::int, url::str)] }, heap of the
+        # urls waiting per host. Entries whose seq is no longer the one in
+        # pending were rescored or handed out and are skipped.
+        self.to_be_downloaded = defaultdict(list)
+        # { netloc::str -> int }, number of pending urls per host.
+        self.host_queued = defaultdict(int)
+        # { netloc::str -> int }, number of urls handed out per host.
+        self.host_pages = defaultdict(int)
+        self.sequence = itertools.count()
+        # Heap of (next_fetch_time::float, netloc::str) for every host that
+        # has urls waiting, has fewer downloads in flight than it is allowed,
+        # and whose delay has not passed yet.
+        self.ready_hosts = list()
+        # Heap of (score::float, netloc::str) for the hosts whose delay has
+        # passed, by the score of their best url.
+        self.due_hosts = list()
+        # { netloc::str -> float }, earliest time the host may be hit again.
+        self.next_fetch = dict()
+        # Hosts in ready_hosts or due_hosts.
+        self.scheduled = set()
+        # { netloc::str -> int }, urls handed out and not yet completed per host.
+        self.host_in_flight = defaultdict(int)
+        # { url::str -> depth::int } for urls handed out, so links found on
+        # them get the next depth.
+        self.taken = dict()
+        # Number of urls handed out that have not been marked complete yet.
+        self.in_flight = 0
+        # Guards all of the above; waited on by workers when no host is ready.
+        self.lock = RLock()
+        self.has_work = Condition(self.lock)
+        metrics.gauge("crawler_frontier_size", lambda: len(self.pending))
+        metrics.gauge("crawler_frontier_in_flight", lambda: self.in_flight)
+        metrics.gauge("crawler_hosts_paused", lambda: self.rates.paused())
+
+        # Changes are appended to a write-ahead log and flushed in batches;
+        # the shelve only gets written when the log is compacted into it.
+        self.log_file = f"{self.config.save_file}.log"
+        # { urlhash::str -> (url::str, completed::bool, depth::int) } logged
+        # since the last compaction, not yet in the shelve. Keys are _key(url).
+        # Save files from before depth was kept hold (url, completed).
+        self.unsaved = dict()
+        # Log lines waiting for the next group commit.
+        self.log_buffer = list()
+        self.last_flush = time.time()
         
         if not os.path.exists(self.config.save_file) and not restart:
             # Save file does not exist, but request to load save.
@@ -23,50 +90,434 @@ class Frontier(object):
             self.logger.info(
                 f"Found save file {self.config.save_file}, deleting it.")
             os.remove(self.config.save_file)
-        # Load existing save file, or create one if it does not exist.
-        self.save = shelve.open(self.config.save_file)
+        if os.path.exists(self.log_file) and restart:
+            os.remove(self.log_file)
+
+        # The urls still to be downloaded are also kept in their own shelve,
+        # { urlhash::str -> (url::str, depth::int) }, so resuming only reads
+        # those instead of every url ever discovered. The counts are kept in
+        # a small json file next to it; a save file without one is from
+        # before and gets migrated by a full scan.
+        self.pending_file = f"{self.config.save_file}.pending"
+        self.meta_file = f"{self.config.save_file}.meta"
         if restart:
-            for url in self.config.seed_urls:
-                self.add_url(url)
+            for path in (self.pending_file, self.meta_file):
+                if os.path.exists(path):
+                    os.remove(path)
+        self.migrated = restart or os.path.exists(self.meta_file)
+        if os.path.exists(self.meta_file):
+            with open(self.meta_file, "r") as f:
+                self.counts = json.load(f)
+        else:
+            self.counts = {"discovered": 0, "completed": 0}
+
+        # Saved next to the shelve on every compaction, the urls added since
+        # the last one appended to SAVE.seen.log, so resuming does not have
+        # to rebuild it from every url in the save file.
+        self.seen_file = f"{self.config.save_file}.seen"
+        self.seen_loaded = os.path.exists(self.seen_file) and not restart
+        if self.seen_loaded:
+            self.seen = self.seen_factory.load(
+                self.seen_file, self.config.seen_error_rate)
+        else:
+            for path in (self.seen_file, f"{self.seen_file}.log"):
+                if os.path.exists(path):
+                    os.remove(path)
+            self.seen = self.seen_factory(self.config.seen_error_rate)
+
+        # Content fingerprints of downloaded pages, used by the scraper to
+        # skip duplicates. A page's fingerprint is logged with its completion
+        # and appended to the file on compaction.
+        self.fingerprint_file = f"{self.config.save_file}.fp"
+        if os.path.exists(self.fingerprint_file) and not restart:
+            self.fingerprints = FingerprintIndex.load(
+                self.fingerprint_file, self.config.near_duplicate_distance)
         else:
-            # Set the frontier state with contents of save file.
-            self._parse_save_file()
-            if not self.save:
+            if os.path.exists(self.fingerprint_file):
+                os.remove(self.fingerprint_file)
+            self.fingerprints = FingerprintIndex(
+                self.config.near_duplicate_distance)
+
+        # Per url template counts, used by the scraper to stop following
+        # crawler traps. Saved like the seen set, the templates changed
+        # since the last compaction appended to SAVE.traps.log.
+        self.trap_file = f"{self.config.save_file}.traps"
+        trap_settings = (
+            self.config.trap_samples, self.config.trap_novelty,
+            self.config.trap_max_urls, self.config.trap_repeat)
+        if os.path.exists(self.trap_file) and not restart:
+            self.traps = TrapDetector.load(self.trap_file, *trap_settings)
+        else:
+            for path in (self.trap_file, f"{self.trap_file}.log"):
+                if os.path.exists(path):
+                    os.remove(path)
+            self.traps = TrapDetector(*trap_settings)
+
+        # Load existing save file, or create one if it does not exist.
+        self.save = shelve.open(self.config.save_file)
+        self.pending_save = shelve.open(self.pending_file)
+        if not restart:
+            # Apply changes logged after the last compaction.
+            self._replay_log()
+        self.log = open(self.log_file, "a")
+        # True when this run carries on a crawl saved by an earlier one.
+        self.resumed = False
+        with self.lock:
+            if restart:
                 for url in self.config.seed_urls:
                     self.add_url(url)
+            else:
+                # Set the frontier state with contents of save file.
+                self._parse_save_file()
+                self.resumed = bool(self.save)
+                if not self.resumed:
+                    for url in self.config.seed_urls:
+                        self.add_url(url)
 
     def _parse_save_file(self):
         ''' This function can be overridden for alternate saving techniques. '''
-        total_count = len(self.save)
-        tbd_count = 0
-        for url, completed in self.save.values():
-            if not completed and is_valid(url):
-                self.to_be_downloaded.append(url)
-                tbd_count += 1
+        if not self.migrated:
+            self._migrate()
+        elif not self.seen_loaded:
+            for value in self.save.values():
+                self.seen.add(value[0])
+        dropped = list()
+        for urlhash, (url, depth) in self.pending_save.items():
+            # Urls were checked when they were found; checking again is only
+            # needed after the filter rules changed. They were counted
+            # against their trap template then, so they are only checked.
+            if self.config.revalidate and not (
+                    is_valid(url, record=False)
+                    and self.traps.admit(url, record=False)):
+                dropped.append(urlhash)
+                continue
+            self._enqueue(url, depth)
+        if dropped:
+            for urlhash in dropped:
+                del self.pending_save[urlhash]
+            self.pending_save.sync()
+            self.logger.info(
+                f"Dropped {len(dropped)} pending urls the filter no longer allows.")
         self.logger.info(
-            f"Found {tbd_count} urls to be downloaded from {total_count} "
-            f"total urls discovered.")
+            f"Found {len(self.pending)} urls to be downloaded from "
+            f"{self.counts['discovered']} total urls discovered, "
+            f"{self.counts['completed']} completed.")
 
-    def get_tbd_url(self):
-        try:
-            return self.to_be_downloaded.pop()
-        except IndexError:
-            return None
+    def _migrate(self):
+        ''' Builds the pending shelve and the counts from a save file written
+        before they existed. Reads every url once. '''
+        legacy = list()
+        self.pending_save.clear()
+        self.counts = {"discovered": 0, "completed": 0}
+        for urlhash, value in self.save.items():
+            url, completed = value[:2]
+            if urlhash != self._key(url):
+                legacy.append(urlhash)
+            if not self.seen_loaded:
+                self.seen.add(url)
+            self.counts["discovered"] += 1
+            if completed:
+                self.counts["completed"] += 1
+            else:
+                self.pending_save[self._key(url)] = (url, value[2] if len(value) > 2 else 0)
+        if legacy:
+            self._rekey(legacy)
+        self.pending_save.sync()
+        self._save_counts()
+        self.migrated = True
+        self.logger.info(
+            f"Migrated {self.counts['discovered']} urls in the save file to "
+            f"{self.pending_file}.")
 
-    def add_url(self, url):
-        url = normalize(url)
-        urlhash = get_urlhash(url)
-        if urlhash not in self.save:
-            self.save[urlhash] = (url, False)
+    def _save_counts(self):
+        with open(f"{self.meta_file}.tmp", "w") as f:
+            json.dump(self.counts, f)
+        os.replace(f"{self.meta_file}.tmp", self.meta_file)
+
+    def _rekey(self, urlhashes):
+        ''' Moves entries of save files written with the old 64 character
+        sha256 keys to the short digest keys. '''
+        for urlhash in urlhashes:
+            value = self.save.pop(urlhash)
+            self.save[self._key(value[0])] = value
+        self.save.sync()
+        self.logger.info(f"Rekeyed {len(urlhashes)} urls in the save file.")
+
+    @staticmethod
+    def _key(url):
+        return get_urldigest(url).hex()
+
+    def _replay_log(self):
+        ''' Applies the logged changes to the shelve. The log itself is kept
+        until the next compaction: only that saves the seen set, fingerprints
+        and trap counts along with the shelve, and until then a crash must
+        be able to replay these changes into them again. '''
+        if not os.path.exists(self.log_file):
+            return
+        replayed = 0
+        # Bytes of the log up to the last complete line.
+        good = 0
+        with open(self.log_file, "rb") as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("unterminated line")
+                    value = tuple(json.loads(line))
+                except ValueError:
+                    # A torn last line from a crash, everything after it
+                    # was never acknowledged.
+                    break
+                good += len(line)
+                if len(value) > 3:
+                    # The fingerprint of a completed page.
+                    self.fingerprints.restore(*value[3:])
+                    value = value[:3]
+                url, completed = value[:2]
+                urlhash = self._key(url)
+                if self.migrated:
+                    # The log may repeat changes already compacted, so only
+                    # count what the shelve does not have yet.
+                    old = self.save.get(urlhash)
+                    if old is None:
+                        self.counts["discovered"] += 1
+                    if completed and not (old and old[1]):
+                        self.counts["completed"] += 1
+                    self._save_pending(urlhash, value)
+                self.save[urlhash] = value
+                self.seen.add(url)
+                replayed += 1
+        self.save.sync()
+        if self.migrated:
+            self.pending_save.sync()
+            self._save_counts()
+        # New changes are appended after the last complete line.
+        os.truncate(self.log_file, good)
+        self.logger.info(
+            f"Replayed {replayed} changes from {self.log_file}.")
+
+    def _record(self, urlhash, url, completed, depth, fingerprint=None):
+        ''' Logs a change; it is durable after the next group commit. '''
+        self.unsaved[urlhash] = (url, completed, depth)
+        self.counts["completed" if completed else "discovered"] += 1
+        line = [url, completed, depth]
+        if fingerprint is not None:
+            line.extend(fingerprint)
+        self.log_buffer.append(json.dumps(line))
+        if (len(self.log_buffer) >= self.config.save_batch
+                or time.time() - self.last_flush >= self.config.save_interval):
+            self._flush_log()
+        if len(self.unsaved) >= self.config.compact_every:
+            self.compact()
+
+    def _flush_log(self):
+        if self.log_buffer:
+            with metrics.timer("frontier_flush"):
+                self.log.write("\n".join(self.log_buffer) + "\n")
+                self.log.flush()
+                os.fsync(self.log.fileno())
+            self.log_buffer.clear()
+        self.last_flush = time.time()
+
+    def compact(self):
+        ''' Folds the logged changes into the shelve and truncates the log. '''
+        with self.lock, metrics.timer("frontier_compact"):
+            self._flush_log()
+            # Everything in the seen set is now either in the shelve or in
+            # the flushed log, which is replayed into both on startup. The
+            # same goes for the fingerprints of completed pages.
+            self.seen.save(self.seen_file)
+            self.fingerprints.save(self.fingerprint_file)
+            self.traps.save(self.trap_file)
+            for urlhash, value in self.unsaved.items():
+                self.save[urlhash] = value
+                self._save_pending(urlhash, value)
             self.save.sync()
-            self.to_be_downloaded.append(url)
+            self.pending_save.sync()
+            self._save_counts()
+            # Only now is it safe to drop the log; a crash before this point
+            # replays changes that are already in the shelve, which is fine.
+            self.log.close()
+            self.log = open(self.log_file, "w")
+            self.unsaved.clear()
+
+    def _save_pending(self, urlhash, value):
+        if value[1]:
+            self.pending_save.pop(urlhash, None)
+        else:
+            self.pending_save[urlhash] = (value[0], value[2] if len(value) > 2 else 0)
+
+    def close(self):
+        with self.lock:
+            self.compact()
+            self.log.close()
+            os.remove(self.log_file)
+            self.save.close()
+            self.pending_save.close()
+
+    def _enqueue(self, url, depth, inlinks=1):
+        host = urlparse(url).netloc
+        self._push(url, host, depth, inlinks)
+        self.host_queued[host] += 1
+        self._schedule(host)
+
+    def _schedule(self, host):
+        ''' Queues host for its next slot if it has urls waiting and room
+        for another download. '''
+        if (host in self.scheduled or host not in self.host_queued
+                or self.host_in_flight[host] >= self.rates.concurrency(host)):
+            return
+        self.scheduled.add(host)
+        heapq.heappush(self.ready_hosts, (self.next_fetch.get(host, 0), host))
+        self.has_work.notify_all()
+
+    def _push(self, url, host, depth, inlinks):
+        seq = next(self.sequence)
+        self.pending[url] = (depth, inlinks, seq)
+        heapq.heappush(
+            self.to_be_downloaded[host],
+            (self.score(url, depth, inlinks, self.host_pages[host]), seq, url))
+
+    def _live(self, entry):
+        pending = self.pending.get(entry[2])
+        return pending is not None and pending[2] == entry[1]
+
+    def _rediscover(self, url, depth):
+        ''' A pending url was found again: count the inlink, keep the
+        shallowest depth, and move it to its new place in the host's heap. '''
+        old_depth, inlinks, _ = self.pending[url]
+        host = urlparse(url).netloc
+        self._push(url, host, min(depth, old_depth), inlinks + 1)
+        queue = self.to_be_downloaded[host]
+        if len(queue) > 2 * self.host_queued[host] + 64:
+            # Mostly outdated entries, drop them.
+            queue[:] = [entry for entry in queue if self._live(entry)]
+            heapq.heapify(queue)
+
+    def _head(self, host):
+        ''' The best pending url of host, which must have one. '''
+        queue = self.to_be_downloaded[host]
+        while not self._live(queue[0]):
+            heapq.heappop(queue)
+        return queue[0][2]
+
+    def _host_score(self, host):
+        url = self._head(host)
+        depth, inlinks, _ = self.pending[url]
+        return self.score(url, depth, inlinks, self.host_pages[host])
+
+    def get_tbd_url(self, timeout=None):
+        ''' Blocks until a url from a host whose politeness delay has passed
+        is available. Returns None once nothing is queued and no url is in
+        flight, and raises queue.Empty if timeout seconds pass first. '''
+        deadline = None if timeout is None else time.time() + timeout
+        with self.has_work:
+            while True:
+                wait = None
+                now = time.time()
+                while self.ready_hosts and self.ready_hosts[0][0] <= now:
+                    next_fetch, host = heapq.heappop(self.ready_hosts)
+                    if self.next_fetch.get(host, 0) > now:
+                        # Pushed back after it was scheduled.
+                        heapq.heappush(self.ready_hosts, (self.next_fetch[host], host))
+                        continue
+                    heapq.heappush(self.due_hosts, (self._host_score(host), host))
+                if self.due_hosts:
+                    # Of all hosts that may be hit now, the one with the best url.
+                    score, host = heapq.heappop(self.due_hosts)
+                    return self._take(host)
+                if self.ready_hosts:
+                    wait = self.ready_hosts[0][0] - now
+                elif self._finished():
+                    # Nothing queued and no worker can add more: crawl is done.
+                    return None
+                if deadline is not None:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise Empty
+                    wait = remaining if wait is None else min(wait, remaining)
+                if self.poll_interval is not None:
+                    wait = self.poll_interval if wait is None else min(wait, self.poll_interval)
+                self.has_work.wait(wait)
+
+    def _finished(self):
+        ''' Called with nothing queued: True if no more urls can arrive. '''
+        return not self.in_flight
+
+    def _take(self, host):
+        url = self._head(host)
+        heapq.heappop(self.to_be_downloaded[host])
+        depth, inlinks, seq = self.pending.pop(url)
+        self.taken[url] = depth
+        self.host_pages[host] += 1
+        self.host_queued[host] -= 1
+        if not self.host_queued[host]:
+            del self.host_queued[host]
+            del self.to_be_downloaded[host]
+        self.in_flight += 1
+        # Requests to a host start at least its delay apart. With room for
+        # more than one download in flight it can be scheduled again now;
+        # otherwise only once this one is marked complete.
+        self.scheduled.discard(host)
+        self.host_in_flight[host] += 1
+        self.next_fetch[host] = time.time() + self.rates.delay(host)
+        self._schedule(host)
+        return url
+
+    def add_url(self, url, parent=None):
+        ''' Adds url, found on the page of parent (a url handed out and not
+        yet marked complete) or a seed url if parent is None. '''
+        url = normalize(url)
+        with self.lock:
+            self._add(url, self._depth_below(parent))
+
+    def _depth_below(self, parent):
+        if parent is None:
+            return 0
+        return self.taken.get(parent, -1) + 1
+
+    def _add(self, url, depth):
+        if self.seen.add(url):
+            self._record(self._key(url), url, False, depth)
+            self._enqueue(url, depth)
+        elif url in self.pending:
+            self._rediscover(url, depth)
     
+    def observe(self, url, status, latency, retry_after=None):
+        ''' Feeds the result of downloading url to the rate control of its
+        host. Called before mark_url_complete. '''
+        host = urlparse(url).netloc
+        with self.lock:
+            if self.rates.observe(host, status, latency, retry_after):
+                self.logger.info(
+                    f"Too many errors from {host}, pausing it for "
+                    f"{self.config.cooldown} seconds.")
+
     def mark_url_complete(self, url):
-        urlhash = get_urlhash(url)
-        if urlhash not in self.save:
-            # This should not happen.
-            self.logger.error(
-                f"Completed url {url}, but have not seen it before.")
+        with self.lock:
+            if url not in self.seen:
+                # This should not happen.
+                self.logger.error(
+                    f"Completed url {url}, but have not seen it before.")
 
-        self.save[urlhash] = (url, True)
-        self.save.sync()
+            # The page's fingerprint only becomes durable with its
+            # completion, so a crash before that never leaves a page to be
+            # downloaded again that looks like a duplicate of itself.
+            self._record(
+                self._key(url), url, True, self.taken.pop(url, 0),
+                self.fingerprints.commit(url))
+
+            # The host may be hit again once its delay has passed, counted
+            # from now, and after any pause the rate control asked for.
+            host = urlparse(url).netloc
+            self.host_in_flight[host] -= 1
+            if not self.host_in_flight[host]:
+                del self.host_in_flight[host]
+            self.next_fetch[host] = max(
+                self.next_fetch.get(host, 0),
+                time.time() + self.rates.delay(host),
+                self.rates.resume_at(host))
+            self._schedule(host)
+            self.in_flight -= 1
+            # Wake everyone: either a host is schedulable again or, if this
+            # was the last url in flight, waiting workers should stop.
+            self.has_work.notify_all()
@@ -0,0 +1,91 @@
+import os
+import sys
+import importlib.util
+
+from threading import Thread
+from queue import Queue
+
+from utils import get_logger
+from utils.metrics import metrics
+
+# The Indexer of Assignment 4, which lives outside this package.
+INDEXER_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    os.pardir, "Assignment 4", "indexer.py")
+
+
+def load_indexer_class(path=INDEXER_PATH):
+    # The indexer imports the modules next to it, as when it runs from its folder.
+    folder = os.path.abspath(os.path.dirname(path))
+    if folder not in sys.path:
+        sys.path.append(folder)
+    spec = importlib.util.spec_from_file_location("indexer", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.Indexer
+
+
+def start_indexing(config, frontier):
+    ''' The IndexingStage for this run, or None if INDEX is not set or the
+    frontier resumed a saved crawl. The Indexer keeps its doc ids, duplicate
+    hashes and postings in memory until close, so an index built after a
+    resume would only hold the pages crawled since. '''
+    if not config.index_dir:
+        return None
+    if frontier.resumed:
+        get_logger("INDEXER").warning(
+            f"Not indexing into {config.index_dir}: resuming from "
+            f"{config.save_file}, and the index would only cover the pages "
+            f"crawled from now on. Run with --restart to build the index.")
+        return None
+    return IndexingStage(config)
+
+
+class IndexingStage(Thread):
+    ''' Builds the inverted index while the crawl runs. The scraper hands
+    every page it keeps to submit, and this thread feeds them to the
+    Indexer. The queue holds at most INDEXQUEUE pages; when indexing falls
+    behind, submit blocks and the crawl slows down to match. close writes
+    the final index, lookup table and byte offsets to INDEX. '''
+
+    def __init__(self, config):
+        self.logger = get_logger("INDEXER")
+        os.makedirs(config.index_dir, exist_ok=True)
+        # The Indexer appends to index.txt, and numbers its partial indexes
+        # from 0 again; nothing left by an earlier crawl may get mixed in.
+        for name in os.listdir(config.index_dir):
+            if name == "index.txt" or (
+                    name.startswith("partial_index_") and name.endswith(".txt")):
+                os.remove(os.path.join(config.index_dir, name))
+        self.indexer = load_indexer_class()(
+            None,
+            os.path.join(config.index_dir, "index.txt"),
+            os.path.join(config.index_dir, "lookup.json"),
+            os.path.join(config.index_dir, "byte_offset.json"),
+            False, partial_dir=config.index_dir)
+        self.queue = Queue(maxsize=config.index_queue_size)
+        metrics.gauge("crawler_index_queue", self.queue.qsize)
+        super().__init__(daemon=True)
+        self.start()
+
+    def submit(self, url, content):
+        self.queue.put((url, content))
+
+    def run(self):
+        while True:
+            page = self.queue.get()
+            if page is None:
+                break
+            try:
+                with metrics.timer("index"):
+                    self.indexer.process_document(*page)
+            except Exception:
+                self.logger.exception(f"Failed to index {page[0]}.")
+
+    def close(self):
+        self.queue.put(None)
+        self.join()
+        self.indexer.final()
+        self.logger.info(
+            f"Indexed {self.indexer.doc_id - 1} of {self.indexer.total} "
+            f"pages into {self.indexer.index_file}.")
@@ -0,0 +1,37 @@
+''' Scoring functions deciding which url the frontier hands out next.
+Lower scores are downloaded first, equal scores in discovery order.
+
+Every scorer is called as score(url, depth, inlinks, host_pages):
+    depth: number of links followed from a seed url to find it.
+    inlinks: number of times it was found so far.
+    host_pages: number of urls already handed out from its host.
+Within a host the scores are computed when a url is queued (and again
+when it is found again); across hosts that are due, the head url of each
+host is scored again with the current host_pages.
+'''
+import math
+
+
+def breadth_first(url, depth, inlinks, host_pages):
+    return depth
+
+
+def quality(url, depth, inlinks, host_pages):
+    ''' Mostly breadth first. One more level of depth costs as much as 100
+    more characters of url, half as many inlinks, or 500 more pages
+    already downloaded from the host. '''
+    return (depth + len(url) / 100 - math.log2(inlinks)
+            + host_pages / 500)
+
+
+SCORERS = {
+    "breadth": breadth_first,
+    "quality": quality,
+}
+
+
+def get_scorer(name):
+    if name not in SCORERS:
+        raise ValueError(
+            f"Unknown PRIORITY {name}, choose one of {', '.join(SCORERS)}.")
+    return SCORERS[name]
@@ -0,0 +1,95 @@
+import time
+
+# Requests per second added to a host's rate after each good response.
+RATE_STEP = 0.1
+# A host counts as healthy while its average latency is within this factor
+# of the best average seen for it; only then may its concurrency grow.
+HEALTHY_LATENCY = 2.0
+
+
+class HostRate(object):
+    __slots__ = ("delay", "concurrency", "latency", "best_latency", "failures", "resume_at")
+
+    def __init__(self, delay):
+        # Seconds between two requests to the host.
+        self.delay = delay
+        # Requests allowed in flight at once, grown fractionally.
+        self.concurrency = 1.0
+        # Moving average of the download time, and the lowest it has been.
+        self.latency = None
+        self.best_latency = None
+        # Failures in a row, reset by any good response.
+        self.failures = 0
+        # Time before which the host must not be hit, from a cooldown or
+        # a Retry-After.
+        self.resume_at = 0.0
+
+
+class RateController(object):
+    ''' Adapts the delay and concurrency of each host to how it responds,
+    AIMD style. A good response adds RATE_STEP requests per second (the
+    delay never drops below POLITENESS) and, while latency is healthy,
+    lets one more request in flight per round of requests, up to
+    MAXHOSTCONCURRENCY. A failure (timeout, 429, 5xx or a cache server
+    error) doubles the delay, up to MAXDELAY, and halves the concurrency.
+    ERRORBURST failures in a row pause the host for COOLDOWN seconds, and
+    a Retry-After pauses it for as long as it asks, up to MAXDELAY. '''
+
+    def __init__(self, config):
+        self.floor = config.time_delay
+        self.max_delay = max(config.max_delay, self.floor)
+        self.max_concurrency = max(1, config.max_host_concurrency)
+        self.error_burst = config.error_burst
+        self.cooldown = config.cooldown
+        # { netloc::str -> HostRate }
+        self.hosts = dict()
+
+    def _rate(self, host):
+        rate = self.hosts.get(host)
+        if rate is None:
+            rate = self.hosts[host] = HostRate(self.floor)
+        return rate
+
+    def delay(self, host):
+        return self._rate(host).delay
+
+    def concurrency(self, host):
+        return int(self._rate(host).concurrency)
+
+    def resume_at(self, host):
+        return self._rate(host).resume_at
+
+    def paused(self, now=None):
+        ''' Number of hosts in a cooldown or Retry-After pause. Called by the
+        metrics gauge without the frontier lock, so it counts over a copy:
+        _rate may add a host while it runs. '''
+        now = time.time() if now is None else now
+        return sum(1 for rate in list(self.hosts.values()) if rate.resume_at > now)
+
+    def observe(self, host, status, latency, retry_after=None, now=None):
+        ''' Updates host from one download. Returns True if this started a
+        cooldown. '''
+        now = time.time() if now is None else now
+        rate = self._rate(host)
+        failed = status == 0 or status == 429 or status >= 500
+        if retry_after:
+            rate.resume_at = max(rate.resume_at, now + min(retry_after, self.max_delay))
+        if failed:
+            rate.failures += 1
+            rate.delay = min(self.max_delay, max(rate.delay * 2, self.floor, 1.0))
+            rate.concurrency = max(1.0, rate.concurrency / 2)
+            if self.error_burst and rate.failures >= self.error_burst:
+                rate.failures = 0
+                rate.resume_at = max(rate.resume_at, now + self.cooldown)
+                return True
+            return False
+        rate.failures = 0
+        rate.latency = latency if rate.latency is None else 0.8 * rate.latency + 0.2 * latency
+        if rate.best_latency is None or rate.latency < rate.best_latency:
+            rate.best_latency = rate.latency
+        if rate.delay > self.floor:
+            rate.delay = max(self.floor, 1 / (1 / rate.delay + RATE_STEP))
+        if rate.latency <= HEALTHY_LATENCY * rate.best_latency:
+            rate.concurrency = min(
+                self.max_concurrency, rate.concurrency + 1 / rate.concurrency)
+        return False
@@ -0,0 +1,154 @@
+import os
+import copy
+import multiprocessing
+
+from functools import partial
+from hashlib import blake2b
+from queue import Empty
+from threading import Thread
+from urllib.parse import urlparse
+
+from utils import configure_logging, get_logger, normalize, stop_logging
+from utils.seen import SeenSet
+from crawler.frontier import Frontier
+from crawler import Crawler
+import scraper
+
+
+def shard_of(url, shards):
+    ''' Index of the process that owns url's host. Stable across processes
+    and runs, unlike hash(). '''
+    netloc = urlparse(url).netloc.encode("utf-8")
+    return int.from_bytes(blake2b(netloc, digest_size=8).digest(), "big") % shards
+
+
+class ShardedFrontier(Frontier):
+    ''' Frontier for one of several crawler processes. It only keeps the
+    hosts whose shard_of is its shard and routes every other url to the
+    owning process's inbox. Politeness stays per host because each host
+    lives in exactly one shard.
+
+    outstanding is shared by all processes and counts urls that are queued
+    in a shard, in flight, or waiting in an inbox. The crawl is over when
+    it reaches zero. Increments always happen before the matching
+    decrement, so it can never drop to zero while work remains. '''
+    poll_interval = 0.5
+
+    def __init__(self, config, restart, shard, inboxes, outstanding):
+        self.shard = shard
+        self.inboxes = inboxes
+        self.outstanding = outstanding
+        # Urls already sent to other shards, so each is routed once per run.
+        # Not saved: after a resume they are sent again and deduplicated by
+        # their owner.
+        self.routed = SeenSet()
+        super().__init__(config, restart)
+        self.receiver = Thread(target=self._receive, daemon=True)
+        self.receiver.start()
+
+    def _count(self, delta):
+        with self.outstanding.get_lock():
+            self.outstanding.value += delta
+
+    def _receive(self):
+        inbox = self.inboxes[self.shard]
+        while True:
+            item = inbox.get()
+            if item is None:
+                break
+            url, depth = item
+            with self.lock:
+                self._add(url, depth)
+            # Counted in _enqueue first if it was new, so only now drop
+            # the count it had while in transit.
+            self._count(-1)
+
+    def _enqueue(self, url, depth, inlinks=1):
+        super()._enqueue(url, depth, inlinks)
+        self._count(1)
+
+    def _finished(self):
+        return not self.in_flight and self.outstanding.value == 0
+
+    def add_url(self, url, parent=None):
+        url = normalize(url)
+        owner = shard_of(url, len(self.inboxes))
+        if owner == self.shard:
+            super().add_url(url, parent)
+        elif self.routed.add(url):
+            # Only the first time is sent, so the owner does not see the
+            # inlinks from other shards.
+            with self.lock:
+                depth = self._depth_below(parent)
+            self._count(1)
+            self.inboxes[owner].put((url, depth))
+
+    def mark_url_complete(self, url):
+        super().mark_url_complete(url)
+        self._count(-1)
+
+    def close(self):
+        self.inboxes[self.shard].put(None)
+        self.receiver.join()
+        super().close()
+
+
+def run_shard(config, restart, engine, shard, inboxes, outstanding, barrier, reports):
+    config = copy.copy(config)
+    # Each shard keeps its own save file, and resumes from it.
+    config.save_file = f"{config.save_file}.shard{shard}"
+    if config.metrics_port:
+        config.metrics_port += shard
+    if config.metrics_file:
+        config.metrics_file = f"{config.metrics_file}.shard{shard}"
+    if config.index_dir:
+        config.index_dir = os.path.join(config.index_dir, f"shard{shard}")
+    frontier_factory = partial(
+        ShardedFrontier, shard=shard, inboxes=inboxes, outstanding=outstanding)
+    if engine == "async":
+        from crawler.async_crawler import AsyncCrawler
+        crawler = AsyncCrawler(config, restart, frontier_factory=frontier_factory)
+    else:
+        crawler = Crawler(config, restart, frontier_factory=frontier_factory)
+    # Nobody may see outstanding at zero before every shard has loaded its
+    # pending urls and seeds.
+    barrier.wait()
+    try:
+        crawler.start()
+        reports.put(scraper.analytics.export())
+    finally:
+        # The process exits without running atexit handlers.
+        stop_logging()
+
+
+def start_sharded(config, restart, engine, processes):
+    ''' Runs the crawl in processes crawler processes, one per shard. '''
+    inboxes = [multiprocessing.Queue() for _ in range(processes)]
+    outstanding = multiprocessing.Value("q", 0)
+    barrier = multiprocessing.Barrier(processes)
+    reports = multiprocessing.Queue()
+    shards = [
+        multiprocessing.Process(
+            target=run_shard,
+            args=(config, restart, engine, shard, inboxes, outstanding, barrier, reports))
+        for shard in range(processes)]
+    for process in shards:
+        process.start()
+    # Read before joining: a process does not exit until what it put on
+    # the queue is read. A shard that failed never sends its analytics.
+    received = 0
+    while received < processes:
+        try:
+            scraper.analytics.merge(reports.get(timeout=1))
+            received += 1
+        except Empty:
+            if not any(process.is_alive() for process in shards):
+                break
+    for process in shards:
+        process.join()
+    configure_logging(config)
+    logger = get_logger("CRAWLER")
+    if received < processes:
+        logger.warning(f"Analytics missing for {processes - received} of {processes} processes.")
+    logger.info(f"Analytics of all {processes} processes:")
+    scraper.get_analytics()
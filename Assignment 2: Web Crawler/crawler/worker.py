@@ -3,9 +3,13 @@ from threading import Thread
 from inspect import getsource
 from utils.download import download
 from utils import get_logger
+from utils.metrics import metrics
 import scraper
 import time
 
+# Statuses whose Retry-After header is passed on to the frontier.
+RETRY_STATUSES = {429, 503}
+
 
 class Worker(Thread):
     def __init__(self, worker_id, config, frontier):
@@ -22,12 +26,23 @@ class Worker(Thread):
             if not tbd_url:
                 self.logger.info("Frontier is empty. Stopping Crawler.")
                 break
-            resp = download(tbd_url, self.config, self.logger)
-            self.logger.info(
-                f"Downloaded {tbd_url}, status <{resp.status}>, "
-                f"using cache {self.config.cache_server}.")
-            scraped_urls = scraper.scraper(tbd_url, resp)
-            for scraped_url in scraped_urls:
-                self.frontier.add_url(scraped_url)
-            self.frontier.mark_url_complete(tbd_url)
-            time.sleep(self.config.time_delay)
+            start = time.perf_counter()
+            try:
+                resp = download(tbd_url, self.config, self.logger)
+                self.frontier.observe(
+                    tbd_url, resp.status, time.perf_counter() - start,
+                    resp.retry_after if resp.status in RETRY_STATUSES else None)
+                self.logger.info(
+                    f"Downloaded {tbd_url}, status <{resp.status}>, "
+                    f"using cache {self.config.cache_server}.",
+                    extra={"sample": True})
+                scraped_urls = scraper.scraper(tbd_url, resp)
+                with metrics.timer("frontier_add"):
+                    for scraped_url in scraped_urls:
+                        self.frontier.add_url(scraped_url, tbd_url)
+            finally:
+                # Always release the url, otherwise the other workers would
+                # wait forever on a url that is still counted as in flight.
+                self.frontier.mark_url_complete(tbd_url)
+                metrics.inc("crawler_pages_total")
+                metrics.observe("page", time.perf_counter() - start)
@@ -6,12 +6,27 @@ from utils.config import Config
 from crawler import Crawler
 
 
-def main(config_file, restart):
+def main(config_file, restart, engine, cache_server=None, processes=1,
+         revalidate=False):
     cparser = ConfigParser()
     cparser.read(config_file)
     config = Config(cparser)
-    config.cache_server = get_cache_server(config, restart)
-    crawler = Crawler(config, restart)
+    config.revalidate = revalidate
+    if cache_server:
+        # Skip registration and talk to a known server, e.g. utils.cache_server.
+        host, port = cache_server.rsplit(":", 1)
+        config.cache_server = (host, int(port))
+    else:
+        config.cache_server = get_cache_server(config, restart)
+    if processes > 1:
+        from crawler.sharded import start_sharded
+        start_sharded(config, restart, engine, processes)
+        return
+    if engine == "async":
+        from crawler.async_crawler import AsyncCrawler
+        crawler = AsyncCrawler(config, restart)
+    else:
+        crawler = Crawler(config, restart)
     crawler.start()
 
 
@@ -19,5 +34,14 @@ if __name__ == "__main__":
     parser = ArgumentParser()
     parser.add_argument("--restart", action="store_true", default=False)
     parser.add_argument("--config_file", type=str, default="config.ini")
+    parser.add_argument(
+        "--engine", choices=["threads", "async"], default="threads")
+    parser.add_argument("--cache_server", type=str, default=None)
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument(
+        "--revalidate", action="store_true", default=False,
+        help="Check the saved pending urls against the current scraper rules.")
     args = parser.parse_args()
-    main(args.config_file, args.restart)
+    main(
+        args.config_file, args.restart, args.engine, args.cache_server,
+        args.processes, args.revalidate)
@@ -1,19 +1,65 @@
 import re
 from urllib.parse import urlparse
-from bs4 import BeautifulSoup
-from collections import defaultdict
 from utils import get_logger
-
-visited_urls = set()
-longest_page = {"url": "", "length": 0}
-top_50 = defaultdict(int)
-subdomains = defaultdict(int)
+from utils.analytics import Analytics
+from utils.parsing import get_parser
+from utils.url_filter import UrlFilter
+from utils.seen import SeenSet
+from utils.metrics import metrics
+
+visited_urls = SeenSet()
+analytics = Analytics()
+# Content fingerprints of the pages crawled so far, owned by the frontier.
+fingerprints = None
+# Called with (url, content) for every page kept, see crawler/indexing.py.
+page_sink = None
+# Url template counts for trap detection, owned by the frontier.
+traps = None
 
 logger = get_logger("CRAWLER")
 
+# Static crawl rules, compiled once into url_filter below.
+ALLOWED_DOMAINS = ["ics.uci.edu", "cs.uci.edu", "informatics.uci.edu", "stat.uci.edu", "today.uci.edu/department/information_computer_sciences"]
+DENIED_DOMAINS = ["eecs.uci.edu"]
+QUERY_BLACKLIST = ["replytocom", "share", "page_id", "afg", "ical", "action"]
+PATH_BLACKLIST = ["/events/", "/day/", "/week/", "/month/", "/list/", "?filter"]
+EXTENSIONS = [
+    "css", "js", "bmp", "gif", "jpg", "jpeg", "ico",
+    "png", "tif", "tiff", "mid", "mp2", "mp3", "mp4",
+    "wav", "avi", "mov", "mpeg", "ram", "m4v", "mkv", "ogg", "ogv", "pdf",
+    "ps", "eps", "tex", "ppt", "pptx", "doc", "docx", "xls", "xlsx", "names",
+    "data", "dat", "exe", "bz2", "tar", "msi", "bin", "7z", "psd", "dmg", "iso",
+    "epub", "dll", "cnf", "tgz", "sha1",
+    "thmx", "mso", "arff", "rtf", "jar", "csv",
+    "rm", "smil", "wmv", "swf", "wma", "zip", "rar", "gz"]
+
+url_filter = UrlFilter(
+    ALLOWED_DOMAINS, DENIED_DOMAINS, EXTENSIONS,
+    QUERY_BLACKLIST, PATH_BLACKLIST, max_length=150)
+
+# Parses a page once into its hrefs and text, see utils/parsing.py.
+parse_page = get_parser()
+
+# Bodies larger than this many bytes are not parsed, 0 for no limit.
+max_body_size = 0
+# Content types worth parsing besides text/*. Responses without a
+# Content-Type header are parsed too.
+PAGE_TYPES = {"application/xhtml+xml", "application/xml"}
+
+def configure(config, frontier=None, sink=None):
+    global parse_page, visited_urls, fingerprints, max_body_size, page_sink, traps
+    parse_page = get_parser(config.parser)
+    max_body_size = config.max_body_size
+    visited_urls = SeenSet(config.seen_error_rate)
+    analytics.interval = config.report_interval
+    fingerprints = getattr(frontier, "fingerprints", None)
+    traps = getattr(frontier, "traps", None)
+    page_sink = sink
+
 def scraper(url, resp):
     links = extract_next_links(url, resp)
-    get_analytics()
+    if analytics.due():
+        get_analytics()
     return list(links)
 
 
@@ -28,67 +74,71 @@ def extract_next_links(url, resp):
     #         resp.raw_response.content: the content of the page!
     # Return a list with the hyperlinks (as strings) scrapped from resp.raw_response.content
     links = set()
-    if resp and resp.status == 200 and resp.raw_response and resp.raw_response.content:
-        content = BeautifulSoup(resp.raw_response.content, "html.parser")
-        if check(url, resp):
-            for a_tag in content.findAll("a"):
-                href = a_tag.attrs.get("href")
-                if href:
-                    temp = is_valid(href)
-                    if temp:
-                        links.add(temp)
-                        visited_urls.add(temp)
+    keep = False
+    if resp and resp.status == 200 and is_page(url, resp) and resp.raw_response and resp.raw_response.content:
+        with metrics.timer("parse"):
+            page = parse_page(resp.raw_response.content)
+        with metrics.timer("text"):
+            keep = check(url, page.text)
+        if keep and page_sink is not None:
+            page_sink(url, resp.raw_response.content)
+        if keep:
+            with metrics.timer("filter"):
+                for href in page.hrefs:
+                    if href:
+                        temp = is_valid(href)
+                        if temp:
+                            links.add(temp)
+                            visited_urls.add(temp)
+    if traps is not None:
+        traps.record(url, keep)
     return links
 
 
-def is_valid(url):
+def is_page(url, resp):
+    ''' Checks the size and content type of a response before it is
+    unpickled, so large files and non text documents cost nothing. '''
+    if max_body_size and resp.size > max_body_size:
+        logger.info(
+            f"Skipping {url}, {resp.size} bytes is over the size limit.",
+            extra={"sample": True})
+        metrics.inc("crawler_skipped_total", reason="size")
+        return False
+    content_type = resp.content_type
+    if content_type and not content_type.startswith("text/") and content_type not in PAGE_TYPES:
+        logger.info(
+            f"Skipping {url}, content type {content_type}.",
+            extra={"sample": True})
+        metrics.inc("crawler_skipped_total", reason="content_type")
+        return False
+    return True
+
+
+def is_valid(url, record=True):
     # Decide whether to crawl this url or not. 
     # If you decide to crawl it, return True; otherwise return False.
     # There are already some conditions that return False.
+    # record is False when checking a url found before, which must not be counted against its template again.
     try:
         if url.find("#") == -1:
             new_url = url
         else:
             new_url = url[:url.find("#")]
 
+        # Allowed when it was first found. The frontier still has to see it
+        # again to count the inlink.
         if new_url in visited_urls:
-            return False
-        
-        if len(new_url) > 150:
-            return False
-        
-        parsed = urlparse(url)
+            return new_url
 
-        if parsed.scheme not in set(["http", "https"]):
-            return False
-        
-        query_bl = {"replytocom", "share", "page_id", "afg", "ical", "action"}
-        if any([(query in parsed.query) for query in query_bl]):
-            return False
-
-        domain_wl = ["ics.uci.edu", "cs.uci.edu", "informatics.uci.edu", "stat.uci.edu", "today.uci.edu/department/information_computer_sciences"]
-        if not any([(domain in parsed.netloc) for domain in domain_wl]):
-            return False
+        parsed = urlparse(new_url)
 
-        if "eecs.uci.edu" in parsed.netloc:
-            return False
-        
-        path_bl = {"/events/", "/day/", "/week/", "/month/", "/list/", "?filter"}
-        if any([(path in url.lower()) for path in path_bl]):
+        if not url_filter.allows(new_url, parsed):
             return False
 
-        if re.match(
-            r".*\.(css|js|bmp|gif|jpe?g|ico"
-            + r"|png|tiff?|mid|mp2|mp3|mp4"
-            + r"|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf"
-            + r"|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names"
-            + r"|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso"
-            + r"|epub|dll|cnf|tgz|sha1"
-            + r"|thmx|mso|arff|rtf|jar|csv"
-            + r"|rm|smil|wmv|swf|wma|zip|rar|gz)$", parsed.path.lower()):
+        if traps is not None and not traps.admit(new_url, parsed, record):
             return False
 
-        subdomains[parsed.netloc] += 1
+        analytics.add_subdomain(parsed.netloc, new_url)
 
         return new_url
         
@@ -96,15 +146,12 @@ def is_valid(url):
         print ("TypeError for ", parsed)
         raise
 
-def check(url, resp):
+def check(url, page_text):
     if url.find("#") == -1:
         new_url = url
     else:
         new_url = url[:url.find("#")]
 
-    content = BeautifulSoup(resp.raw_response.content, "html.parser")
-    textlist = content.text.split("\n")
-    text = []
     stopwords = {"ourselves", "hers", "between", "yourself", "but", "again", "there", "about", "once", "during", "out", "very", "having", 
         "with", "they", "own", "an", "be", "some", "for", "do", "its", "yours", "such", "into", "of", "most", "itself", "other", "off", "is", 
         "s", "am", "or", "who", "as", "from", "him", "each", "the", "themselves", "until", "below", "are", "we", "these", "your", "his", "through", 
@@ -113,32 +160,28 @@ def check(url, resp):
         "yourselves",  "then", "that", "because", "what", "over", "why", "so", "can", "did", "not", "now", "under", "he", "you", "herself", "has", 
         "just", "where", "too", "only", "myself", "which", "those", "i", "after", "few", "whom", "t", "being", "if", "theirs", "my", "against", 
         "a", "by", "doing", "it", "how", "further", "was", "here", "than", "d", "b"}
-    for i in textlist:
-        temp = re.findall(r'[0-9a-z]+', i.lower())
-        text.extend(temp)
+    text = re.findall(r'[0-9a-z]+', page_text.lower())
 
     if len(text) < 50:
         return False
 
-    count = 0
-    for i in text:
-        if len(i) >= 3 and i not in stopwords:
-            top_50[i] += 1
-            count += 1
-    
-    if longest_page["length"] < count:
-        longest_page["url"] = new_url
-        longest_page["length"] = count
+    # Mirrors and near identical template pages add no new links worth
+    # downloading, so they are dropped before link extraction.
+    if fingerprints is not None and not fingerprints.add_if_new(text, url):
+        return False
+
+    analytics.add_page(new_url, [i for i in text if len(i) >= 3 and i not in stopwords])
     
     return True
 
 
 def get_analytics():
 
+    longest_page, subdomains = analytics.snapshot()
     logger.info(f"Longest page: {longest_page['url']}, {longest_page['length']}")
-    logger.info(f"Top 50 Words: {sorted(top_50.items(), key = lambda x: -x[1])[:50]}")
+    logger.info(f"Top 50 Words: {analytics.top_words(50)}")
     logger.info(f"Subdomains: {sorted(subdomains.items())}, number of subdomains: {len(subdomains)}")
-    logger.info(f"Number of unique pages: {len(visited_urls)}")
+    logger.info(f"Number of unique pages: {sum(subdomains.values())}")
 
 if __name__ == "__main__":
     print(scraper("https://www.ics.uci.edu", None))
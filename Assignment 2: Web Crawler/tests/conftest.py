@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The crawler's modules are imported from its root folder, as launch.py does.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
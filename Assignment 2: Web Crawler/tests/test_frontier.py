@@ -0,0 +1,241 @@
+import os
+import pickle
+import traceback
+
+from configparser import ConfigParser
+from types import SimpleNamespace
+
+import pytest
+
+from utils.config import Config
+from crawler.frontier import Frontier
+import scraper
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "fork"), reason="crashes are simulated with os.fork")
+
+CONFIG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config.ini")
+
+SEED = "https://www.ics.uci.edu"
+LINKS = ["https://www.ics.uci.edu/about", "https://www.ics.uci.edu/people"]
+
+
+def make_config(tmp_path, **settings):
+    cparser = ConfigParser()
+    cparser.read(CONFIG)
+    config = Config(cparser)
+    config.save_file = str(tmp_path / "frontier.shelve")
+    config.seed_urls = [SEED]
+    config.time_delay = 0
+    # Every change is flushed to the log at once, compactions only happen
+    # when a test asks for them.
+    config.save_batch = 1
+    config.compact_every = 1000000
+    for name, value in settings.items():
+        setattr(config, name, value)
+    return config
+
+
+def page(url, words="information retrieval", links=LINKS):
+    ''' A response for url with enough text to be kept, linking to links. '''
+    text = " ".join(f"{words} {i}" for i in range(40))
+    links = "".join(f'<a href="{link}">{link}</a>' for link in links)
+    content = f"<html><body><p>{text}</p>{links}</body></html>".encode("utf-8")
+    return SimpleNamespace(
+        status=200, size=len(content), content_type="text/html",
+        raw_response=SimpleNamespace(url=url, content=content))
+
+
+def crash(steps):
+    ''' Runs steps in a child process that then dies without closing
+    anything, like a crawler that was killed. '''
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            steps()
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        os._exit(code)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+
+
+def start(config, restart):
+    frontier = Frontier(config, restart)
+    scraper.configure(config, frontier)
+    return frontier
+
+
+def crawl(frontier, url, response=None):
+    links = scraper.scraper(url, response or page(url))
+    for link in links:
+        frontier.add_url(link, url)
+    frontier.mark_url_complete(url)
+    return links
+
+
+@pytest.fixture
+def config(tmp_path, monkeypatch):
+    # The loggers write to Logs/ in the working directory.
+    monkeypatch.chdir(tmp_path)
+    return make_config(tmp_path)
+
+
+def test_resume_from_log(config):
+    def steps():
+        frontier = start(config, True)
+        crawl(frontier, frontier.get_tbd_url(1))
+    crash(steps)
+
+    frontier = start(config, False)
+    assert frontier.resumed
+    assert sorted(frontier.pending) == LINKS
+    assert SEED in frontier.seen
+    assert frontier.counts == {"discovered": 3, "completed": 1}
+    frontier.close()
+
+
+def test_resume_after_compaction_and_torn_log(config):
+    def steps():
+        frontier = start(config, True)
+        crawl(frontier, frontier.get_tbd_url(1))
+        frontier.compact()
+        frontier.mark_url_complete(frontier.get_tbd_url(1))
+        # The crash cut off the last line being written.
+        frontier.log.write('["https://www.ics.uci.edu/pe')
+        frontier.log.flush()
+    crash(steps)
+
+    frontier = start(config, False)
+    assert len(frontier.pending) == 1
+    assert all(url in frontier.seen for url in [SEED] + LINKS)
+    assert frontier.counts == {"discovered": 3, "completed": 2}
+    frontier.close()
+
+
+def test_page_is_not_a_duplicate_of_itself_after_a_crash(config):
+    def steps():
+        frontier = start(config, True)
+        url = frontier.get_tbd_url(1)
+        assert sorted(scraper.scraper(url, page(url))) == LINKS
+        # Another worker compacts while the page is still in flight.
+        frontier.compact()
+    crash(steps)
+
+    frontier = start(config, False)
+    url = frontier.get_tbd_url(1)
+    assert url == SEED
+    assert sorted(scraper.scraper(url, page(url))) == LINKS
+    frontier.close()
+
+
+def test_completed_page_fingerprint_survives_a_crash(config):
+    mirror = "https://www.cs.uci.edu"
+
+    def steps():
+        frontier = start(config, True)
+        crawl(frontier, frontier.get_tbd_url(1))
+    crash(steps)
+
+    def resume():
+        # Only in the log so far.
+        frontier = start(config, False)
+        assert scraper.scraper(mirror, page(mirror)) == []
+        frontier.compact()
+    crash(resume)
+
+    # Now in SAVE.fp.
+    frontier = start(config, False)
+    assert len(frontier.fingerprints) == 1
+    assert scraper.scraper(mirror, page(mirror)) == []
+    assert scraper.scraper(mirror, page(mirror, "search engines")) != []
+    frontier.close()
+
+
+def test_torn_fingerprint_file_is_cut_before_appending(config):
+    mirror = "https://www.cs.uci.edu"
+
+    def steps():
+        frontier = start(config, True)
+        crawl(frontier, frontier.get_tbd_url(1))
+        frontier.compact()
+        # The crash cut off the next fingerprint being appended.
+        with open(frontier.fingerprint_file, "ab") as f:
+            f.write(b"\x01\x02\x03")
+    crash(steps)
+
+    def resume():
+        frontier = start(config, False)
+        url = frontier.get_tbd_url(1)
+        crawl(frontier, url, page(url, "search engines"))
+        frontier.compact()
+    crash(resume)
+
+    frontier = start(config, False)
+    assert len(frontier.fingerprints) == 2
+    assert scraper.scraper(mirror, page(mirror, "search engines")) == []
+    frontier.close()
+
+
+def test_seen_and_traps_are_appended_between_snapshots(config, tmp_path):
+    about = [f"{LINKS[0]}/{name}" for name in ("history", "contact")]
+
+    def steps():
+        frontier = start(config, True)
+        crawl(frontier, frontier.get_tbd_url(1))
+        frontier.compact()
+        with open(frontier.seen_file, "rb") as f:
+            snapshot = f.read()
+        url = frontier.get_tbd_url(1)
+        crawl(frontier, url, page(url, "search engines", about))
+        frontier.compact()
+        # Only the two new urls were appended.
+        with open(frontier.seen_file, "rb") as f:
+            assert f.read() == snapshot
+        assert os.path.getsize(f"{frontier.seen_file}.log") == 2 * 8
+        assert os.path.getsize(f"{frontier.trap_file}.log") > 0
+        with open(tmp_path / "templates", "wb") as f:
+            pickle.dump(frontier.traps.templates, f)
+        # The crash cut off the next records being appended.
+        for path in (frontier.seen_file, frontier.trap_file):
+            with open(f"{path}.log", "ab") as f:
+                f.write(b"\x01\x02\x03")
+    crash(steps)
+
+    def resume():
+        frontier = start(config, False)
+        assert all(url in frontier.seen for url in [SEED] + LINKS + about)
+        with open(tmp_path / "templates", "rb") as f:
+            assert frontier.traps.templates == pickle.load(f)
+        url = frontier.get_tbd_url(1)
+        crawl(frontier, url, page(url, "web crawlers", [f"{url}/{i}" for i in range(8)]))
+        frontier.compact()
+        with open(tmp_path / "templates", "wb") as f:
+            pickle.dump(frontier.traps.templates, f)
+    crash(resume)
+
+    # More urls were added than the snapshot had, so it was rewritten and
+    # the log emptied.
+    frontier = start(config, False)
+    assert os.path.getsize(f"{frontier.seen_file}.log") == 0
+    assert len(frontier.seen) == 13
+    with open(tmp_path / "templates", "rb") as f:
+        assert frontier.traps.templates == pickle.load(f)
+    frontier.close()
+
+
+def test_second_inlink_moves_url_up(config):
+    news = "https://www.ics.uci.edu/news"
+    config.seed_urls = [SEED, news]
+    frontier = start(config, True)
+    assert sorted(crawl(frontier, frontier.get_tbd_url(1))) == LINKS
+    assert frontier.pending[LINKS[0]][1] == frontier.pending[LINKS[1]][1] == 1
+
+    # Found again on another page, a url already seen still reaches the
+    # frontier and counts the inlink.
+    assert frontier.get_tbd_url(1) == news
+    assert crawl(frontier, news, page(news, "search engines", LINKS[1:])) == LINKS[1:]
+    assert frontier.pending[LINKS[1]][1] == 2
+    assert frontier.get_tbd_url(1) == LINKS[1]
+    frontier.close()
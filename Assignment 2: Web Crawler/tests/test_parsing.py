@@ -0,0 +1,43 @@
+import pytest
+
+pytest.importorskip("lxml")
+
+from utils.parsing import parse_html_parser, parse_lxml
+
+PAGE = """<html>
+<head>
+<title>Courses</title>
+<style>.menu { color: red; }</style>
+<script>var tracking = "secret";</script>
+</head>
+<body>
+<p>Information <b>retrieval</b> and <a href="/search">search</a>.</p>
+<script type="text/javascript">function hidden() { return 1; }</script>text after the script
+<template><p>template body</p></template>
+</body>
+</html>"""
+
+
+def test_backends_return_same_text():
+    assert parse_lxml(PAGE).text == parse_html_parser(PAGE).text
+
+
+def test_script_and_style_text_left_out():
+    text = parse_lxml(PAGE).text
+    for hidden in ("color: red", "tracking", "hidden()", "template body"):
+        assert hidden not in text
+    assert "text after the script" in text
+    assert parse_lxml(PAGE).hrefs == parse_html_parser(PAGE).hrefs == ["/search"]
+
+
+@pytest.mark.parametrize("content", [
+    # UTF-8 without any charset declaration.
+    '<html><body><p>Café</p><a href="/people/josé">José</a></body></html>'.encode("utf-8"),
+    '<html><head><meta charset="iso-8859-1"></head><body><a href="/people/josé">José</a></body></html>'.encode("latin-1"),
+    '<?xml version="1.0" encoding="utf-8"?><html><body><a href="/people/josé">José</a></body></html>'.encode("utf-8"),
+    '<html><head><meta charset="no-such-charset"></head><body><a href="/people/josé">José</a></body></html>'.encode("utf-8"),
+])
+def test_backends_decode_bytes_the_same(content):
+    expected = parse_html_parser(content)
+    assert parse_lxml(content) == expected
+    assert expected.hrefs == ["/people/josé"]
@@ -1,25 +1,10 @@
 import os
-import logging
-from hashlib import sha256
+
+from array import array
+from hashlib import sha256, blake2b
 from urllib.parse import urlparse
 
-def get_logger(name, filename=None):
-    logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
-    if not os.path.exists("Logs"):
-        os.makedirs("Logs")
-    fh = logging.FileHandler(f"Logs/{filename if filename else name}.log")
-    fh.setLevel(logging.DEBUG)
-    ch = logging.StreamHandler()
-    ch.setLevel(logging.INFO)
-    formatter = logging.Formatter(
-       "%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-    fh.setFormatter(formatter)
-    ch.setFormatter(formatter)
-    # add the handlers to the logger
-    logger.addHandler(fh)
-    logger.addHandler(ch)
-    return logger
+from utils.log import get_logger, configure_logging, stop_logging
 
 
 def get_urlhash(url):
@@ -29,7 +14,38 @@ def get_urlhash(url):
         f"{parsed.netloc}/{parsed.path}/{parsed.params}/"
         f"{parsed.query}/{parsed.fragment}".encode("utf-8")).hexdigest()
 
+def get_urldigest(url):
+    ''' 8 byte digest of the same url parts as get_urlhash. '''
+    parsed = urlparse(url)
+    return blake2b(
+        f"{parsed.netloc}/{parsed.path}/{parsed.params}/"
+        f"{parsed.query}/{parsed.fragment}".encode("utf-8"),
+        digest_size=8).digest()
+
 def normalize(url):
     if url.endswith("/"):
         return url.rstrip("/")
     return url
+
+def append_records(path, values):
+    ''' Appends values, an array, to path and waits until it is on disk. '''
+    with open(path, "ab") as f:
+        values.tofile(f)
+        f.flush()
+        os.fsync(f.fileno())
+
+def read_records(path, typecode, width=1):
+    ''' The array append_records wrote to path, in records of width
+    values. A crash while appending can leave part of a record at the end;
+    it is cut off the file too, so the next append lines up again. '''
+    values = array(typecode)
+    if not os.path.exists(path):
+        return values
+    with open(path, "rb") as f:
+        data = f.read()
+    end = len(data) - len(data) % (width * values.itemsize)
+    if end < len(data):
+        with open(path, "r+b") as f:
+            f.truncate(end)
+    values.frombytes(data[:end])
+    return values
@@ -0,0 +1,81 @@
+import time
+import heapq
+
+from threading import Lock
+from collections import defaultdict
+
+from utils import get_urldigest
+from utils.seen import DigestSet
+
+
+class Analytics(object):
+    ''' Crawl statistics shared by every worker. Updates only touch counters
+    under a lock; the expensive part, picking the top words and sorting the
+    subdomains, only happens when a report is due. '''
+    def __init__(self, interval=0):
+        # Seconds between reports, 0 to report after every page.
+        self.interval = interval
+        self.last_report = 0
+        self.lock = Lock()
+        self.longest_page = {"url": "", "length": 0}
+        # { word::str -> count::int }
+        self.word_counts = defaultdict(int)
+        # { netloc::str -> DigestSet } digests of the urls found on each
+        # subdomain. Sets rather than counts, so the analytics of several
+        # processes can be merged without counting a url twice.
+        self.subdomains = defaultdict(DigestSet)
+
+    def add_page(self, url, words):
+        with self.lock:
+            for word in words:
+                self.word_counts[word] += 1
+            if self.longest_page["length"] < len(words):
+                self.longest_page["url"] = url
+                self.longest_page["length"] = len(words)
+
+    def add_subdomain(self, netloc, url):
+        digest = int.from_bytes(get_urldigest(url), "big")
+        with self.lock:
+            urls = self.subdomains[netloc]
+            if digest not in urls:
+                urls.add(digest)
+
+    def snapshot(self):
+        ''' Copies of the longest page and subdomain counts. '''
+        with self.lock:
+            return dict(self.longest_page), {
+                netloc: len(urls) for netloc, urls in self.subdomains.items()}
+
+    def export(self):
+        ''' Everything merge needs, picklable, to send to another process. '''
+        with self.lock:
+            return dict(self.longest_page), dict(self.word_counts), dict(self.subdomains)
+
+    def merge(self, exported):
+        ''' Adds the analytics another process exported. '''
+        longest_page, word_counts, subdomains = exported
+        with self.lock:
+            for word, count in word_counts.items():
+                self.word_counts[word] += count
+            for netloc, digests in subdomains.items():
+                urls = self.subdomains[netloc]
+                for digest in digests:
+                    if digest not in urls:
+                        urls.add(digest)
+            if self.longest_page["length"] < longest_page["length"]:
+                self.longest_page = dict(longest_page)
+
+    def top_words(self, k=50):
+        # Same result, ties included, as sorting every count and slicing,
+        # but keeps only a k sized heap.
+        with self.lock:
+            return heapq.nlargest(k, self.word_counts.items(), key=lambda x: x[1])
+
+    def due(self):
+        ''' True, at most once per interval, if a report should be logged. '''
+        now = time.time()
+        with self.lock:
+            if now - self.last_report < self.interval:
+                return False
+            self.last_report = now
+            return True
@@ -0,0 +1,79 @@
+''' Append-only archive of raw cache server answers, for record and replay.
+
+Each record is a header of two big endian 32 bit lengths followed by the
+url (utf-8) and the cbor body exactly as the cache server sent it. A crash
+can only leave a torn last record, which readers ignore. '''
+import os
+import struct
+
+from threading import Lock
+
+HEADER = struct.Struct(">II")
+
+
+class ArchiveWriter(object):
+    def __init__(self, path):
+        self.lock = Lock()
+        self.file = open(path, "ab")
+
+    def append(self, url, body):
+        url = url.encode("utf-8")
+        with self.lock:
+            self.file.write(HEADER.pack(len(url), len(body)))
+            self.file.write(url)
+            self.file.write(body)
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class ArchiveReader(object):
+    ''' Indexes an archive by url; the bodies stay on disk until asked for.
+    If a url was recorded more than once the last answer wins. '''
+    def __init__(self, path):
+        self.lock = Lock()
+        self.file = open(path, "rb")
+        # { url::str -> (offset::int, length::int) }
+        self.index = dict()
+        size = os.fstat(self.file.fileno()).st_size
+        offset = 0
+        while offset + HEADER.size <= size:
+            self.file.seek(offset)
+            url_length, body_length = HEADER.unpack(self.file.read(HEADER.size))
+            end = offset + HEADER.size + url_length + body_length
+            if end > size:
+                break
+            url = self.file.read(url_length).decode("utf-8")
+            self.index[url] = (offset + HEADER.size + url_length, body_length)
+            offset = end
+
+    def __len__(self):
+        return len(self.index)
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def get(self, url):
+        ''' The recorded body for url, or None. '''
+        if url not in self.index:
+            return None
+        offset, length = self.index[url]
+        with self.lock:
+            self.file.seek(offset)
+            return self.file.read(length)
+
+
+# One writer per archive path, shared by every thread of the process.
+_recorders = dict()
+_recorders_lock = Lock()
+
+def get_recorder(config):
+    ''' The writer for config.record_file, or None if recording is off. '''
+    if not config.record_file:
+        return None
+    with _recorders_lock:
+        if config.record_file not in _recorders:
+            _recorders[config.record_file] = ArchiveWriter(config.record_file)
+        return _recorders[config.record_file]
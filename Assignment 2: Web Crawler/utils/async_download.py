@@ -0,0 +1,57 @@
+import time
+import asyncio
+import aiohttp
+import cbor
+
+from utils.download import backoff_delay
+from utils.response import Response
+from utils.metrics import metrics
+from utils.archive import get_recorder
+
+async def download_async(session, url, config, logger=None):
+    ''' Same contract as utils.download.download, over an aiohttp session. '''
+    host, port = config.cache_server
+    status = None
+    start = time.perf_counter()
+    for attempt in range(config.max_retries + 1):
+        if attempt:
+            await asyncio.sleep(backoff_delay(config, attempt))
+        try:
+            async with session.get(
+                    f"http://{host}:{port}/",
+                    params=[("q", f"{url}"), ("u", f"{config.user_agent}")]) as resp:
+                status = resp.status
+                retry_after = resp.headers.get("Retry-After")
+                content = await resp.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            status = None
+            error = repr(e)
+            continue
+        if status < 500:
+            break
+    metrics.observe("download", time.perf_counter() - start)
+    if status is None:
+        metrics.record_download(url, 0, 0)
+        logger.error(f"Spacetime connection error {error} with url {url}.")
+        return Response({
+            "error": f"Spacetime connection error {error} with url {url}.",
+            "status": 0,
+            "url": url})
+    response = None
+    recorder = get_recorder(config)
+    if recorder and status < 400 and content:
+        recorder.append(url, content)
+    try:
+        if status < 400 and content:
+            response = Response(cbor.loads(content))
+    except (EOFError, ValueError) as e:
+        pass
+    if response is None:
+        logger.error(f"Spacetime Response error <{status}> with url {url}.")
+        response = Response({
+            "error": f"Spacetime Response error <{status}> with url {url}.",
+            "status": status,
+            "url": url,
+            "retry_after": retry_after})
+    metrics.record_download(url, response.status, len(content))
+    return response
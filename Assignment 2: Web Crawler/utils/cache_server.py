@@ -0,0 +1,149 @@
+''' A local stand-in for the course cache server, for offline load tests.
+
+It speaks the same protocol as the real one: GET /?q=<url>&u=<useragent>
+answered with a cbor dict holding the status and a pickled
+requests.Response. Pages are either generated from the url, so the crawl
+is the same every run, or replayed from an archive recorded with RECORD
+in config.ini.
+
+    python3 -m utils.cache_server --port 9000 --latency 0.05
+    python3 -m utils.cache_server --port 9000 --replay crawl.archive
+
+Then run the crawler against it with
+    python3 launch.py --restart --cache_server 127.0.0.1:9000
+'''
+import time
+import pickle
+import random
+import cbor
+import requests
+
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qsl
+
+from utils.archive import ArchiveReader
+
+WORDS = (
+    "information retrieval crawler index search query document token "
+    "frontier politeness cache server page link graph rank score student "
+    "research faculty course lecture seminar project software computing "
+    "statistics informatics data model learning systems network").split()
+
+
+def make_response(url, status, content):
+    ''' Encodes a page the way the cache server does. '''
+    raw = requests.models.Response()
+    raw.url = url
+    raw.status_code = status
+    raw.headers["Content-Type"] = "text/html; charset=utf-8"
+    raw._content = content
+    return cbor.dumps({
+        "url": url, "status": status, "response": pickle.dumps(raw)})
+
+
+class SyntheticSite(object):
+    ''' Serves pages_per_host pages on each host, linked to each other
+    and to the other hosts. '''
+    def __init__(self, hosts, pages_per_host=1000, links_per_page=20, words_per_page=300):
+        self.hosts = hosts
+        self.pages_per_host = pages_per_host
+        self.links_per_page = links_per_page
+        self.words_per_page = words_per_page
+
+    def get(self, url):
+        parsed = urlparse(url)
+        path = parsed.path.strip("/")
+        if parsed.netloc not in self.hosts:
+            return 404, b""
+        if not path:
+            page = 0
+        elif path.startswith("page/") and path[5:].isdigit():
+            page = int(path[5:])
+        else:
+            return 404, b""
+        if page >= self.pages_per_host:
+            return 404, b""
+        rand = random.Random(url)
+        links = list()
+        for _ in range(self.links_per_page):
+            host = parsed.netloc if rand.random() < 0.9 else rand.choice(self.hosts)
+            links.append(
+                f'<a href="{parsed.scheme}://{host}/page/'
+                f'{rand.randrange(self.pages_per_host)}">link</a>')
+        words = " ".join(rand.choice(WORDS) for _ in range(self.words_per_page))
+        return 200, (
+            f"<html><head><title>{url}</title></head><body>"
+            f"<p>{words}</p>{''.join(links)}</body></html>").encode("utf-8")
+
+    def respond(self, url):
+        return make_response(url, *self.get(url))
+
+
+class ReplaySource(object):
+    ''' Serves the answers recorded in an archive, byte for byte. Urls that
+    were never recorded get an empty 404 page. '''
+    def __init__(self, archive_path):
+        self.archive = ArchiveReader(archive_path)
+
+    def respond(self, url):
+        body = self.archive.get(url)
+        if body is None:
+            return make_response(url, 404, b"")
+        return body
+
+
+class CacheRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        params = dict(parse_qsl(urlparse(self.path).query))
+        url = params.get("q")
+        if not url or not params.get("u"):
+            self.send_error(400, "Missing q or u parameter.")
+            return
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        body = self.server.source.respond(url)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/cbor")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class LocalCacheServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, source, latency=0):
+        self.source = source
+        self.latency = latency
+        super().__init__(address, CacheRequestHandler)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument(
+        "--latency", type=float, default=0.0,
+        help="Seconds to wait before answering each request.")
+    parser.add_argument(
+        "--hosts", type=str,
+        default="www.ics.uci.edu,www.cs.uci.edu,www.informatics.uci.edu,www.stat.uci.edu")
+    parser.add_argument("--pages_per_host", type=int, default=1000)
+    parser.add_argument(
+        "--replay", type=str, default=None,
+        help="Serve the answers in this archive instead of synthetic pages.")
+    args = parser.parse_args()
+    if args.replay:
+        source = ReplaySource(args.replay)
+        print(f"Replaying {len(source.archive)} recorded urls")
+    else:
+        source = SyntheticSite(args.hosts.split(","), args.pages_per_host)
+    server = LocalCacheServer((args.host, args.port), source, args.latency)
+    print(f"Serving cache on {args.host}:{args.port}")
+    server.serve_forever()
@@ -8,12 +8,48 @@ class Config(object):
         assert self.user_agent != "DEFAULT AGENT", "Set useragent in config.ini"
         assert re.match(r"^[a-zA-Z0-9_ ,]+$", self.user_agent), "User agent should not have any special characters outside '_', ',' and 'space'"
         self.threads_count = int(config["LOCAL PROPERTIES"]["THREADCOUNT"])
+        self.async_concurrency = int(config["LOCAL PROPERTIES"].get("ASYNCCONCURRENCY", fallback="200"))
+        self.parser_threads = int(config["LOCAL PROPERTIES"].get("PARSERTHREADS", fallback="4"))
         self.save_file = config["LOCAL PROPERTIES"]["SAVE"]
+        self.save_batch = int(config["LOCAL PROPERTIES"].get("SAVEBATCH", fallback="200"))
+        self.save_interval = float(config["LOCAL PROPERTIES"].get("SAVEINTERVAL", fallback="5"))
+        self.compact_every = int(config["LOCAL PROPERTIES"].get("COMPACTEVERY", fallback="10000"))
+        self.seen_error_rate = float(config["LOCAL PROPERTIES"].get("SEENERRORRATE", fallback="0.001"))
+        self.metrics_port = int(config["LOCAL PROPERTIES"].get("METRICSPORT", fallback="0"))
+        self.metrics_file = config["LOCAL PROPERTIES"].get("METRICSFILE", fallback="").strip()
+        self.metrics_interval = float(config["LOCAL PROPERTIES"].get("METRICSINTERVAL", fallback="10"))
+        self.console_log_level = config["LOCAL PROPERTIES"].get("LOGLEVEL", fallback="INFO")
+        self.file_log_level = config["LOCAL PROPERTIES"].get("FILELOGLEVEL", fallback="INFO")
+        self.log_sample = int(config["LOCAL PROPERTIES"].get("LOGSAMPLE", fallback="1"))
+        self.record_file = config["LOCAL PROPERTIES"].get("RECORD", fallback="").strip()
+        self.index_dir = config["LOCAL PROPERTIES"].get("INDEX", fallback="").strip()
+        self.index_queue_size = int(config["LOCAL PROPERTIES"].get("INDEXQUEUE", fallback="1000"))
 
         self.host = config["CONNECTION"]["HOST"]
         self.port = int(config["CONNECTION"]["PORT"])
+        self.connect_timeout = float(config["CONNECTION"].get("CONNECTTIMEOUT", fallback="5"))
+        self.read_timeout = float(config["CONNECTION"].get("READTIMEOUT", fallback="30"))
+        self.max_retries = int(config["CONNECTION"].get("MAXRETRIES", fallback="3"))
+        self.backoff = float(config["CONNECTION"].get("BACKOFF", fallback="0.5"))
+        self.backoff_max = float(config["CONNECTION"].get("BACKOFFMAX", fallback="8"))
 
         self.seed_urls = config["CRAWLER"]["SEEDURL"].split(",")
         self.time_delay = float(config["CRAWLER"]["POLITENESS"])
+        self.max_delay = float(config["CRAWLER"].get("MAXDELAY", fallback="30"))
+        self.max_host_concurrency = int(config["CRAWLER"].get("MAXHOSTCONCURRENCY", fallback="1"))
+        self.error_burst = int(config["CRAWLER"].get("ERRORBURST", fallback="5"))
+        self.cooldown = float(config["CRAWLER"].get("COOLDOWN", fallback="60"))
+        self.parser = config["CRAWLER"].get("PARSER", fallback="lxml")
+        self.priority = config["CRAWLER"].get("PRIORITY", fallback="quality")
+        self.report_interval = float(config["CRAWLER"].get("REPORTINTERVAL", fallback="60"))
+        self.near_duplicate_distance = int(config["CRAWLER"].get("NEARDUPDISTANCE", fallback="3"))
+        self.max_body_size = int(config["CRAWLER"].get("MAXBODYSIZE", fallback="5242880"))
+        self.trap_samples = int(config["CRAWLER"].get("TRAPSAMPLES", fallback="20"))
+        self.trap_novelty = float(config["CRAWLER"].get("TRAPNOVELTY", fallback="0.1"))
+        self.trap_max_urls = int(config["CRAWLER"].get("TRAPMAXURLS", fallback="1000"))
+        self.trap_repeat = int(config["CRAWLER"].get("TRAPREPEAT", fallback="3"))
+
+        # Set by launch.py --revalidate.
+        self.revalidate = False
 
         self.cache_server = None
\ No newline at end of file
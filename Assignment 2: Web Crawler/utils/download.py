@@ -1,21 +1,75 @@
 import requests
 import cbor
 import time
+import threading
 
+from requests.adapters import HTTPAdapter
 from utils.response import Response
+from utils.metrics import metrics
+from utils.archive import get_recorder
+
+# One keep-alive session per thread, requests.Session is not thread safe.
+_local = threading.local()
+
+def get_session():
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        # Every request goes to the same cache server, so a single pooled
+        # connection per thread is kept alive and reused.
+        session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        _local.session = session
+    return session
+
+def backoff_delay(config, attempt):
+    ''' Seconds to wait before retry number attempt (starting at 1). '''
+    return min(config.backoff_max, config.backoff * 2 ** (attempt - 1))
 
 def download(url, config, logger=None):
-    host, port = config.cache_server
-    resp = requests.get(
-        f"http://{host}:{port}/",
-        params=[("q", f"{url}"), ("u", f"{config.user_agent}")])
+    with metrics.timer("download"):
+        resp = _fetch(url, config)
+    if isinstance(resp, Exception):
+        metrics.record_download(url, 0, 0)
+        logger.error(f"Spacetime connection error {resp} with url {url}.")
+        return Response({
+            "error": f"Spacetime connection error {resp} with url {url}.",
+            "status": 0,
+            "url": url})
+    response = None
+    recorder = get_recorder(config)
+    if recorder and resp and resp.content:
+        recorder.append(url, resp.content)
     try:
         if resp and resp.content:
-            return Response(cbor.loads(resp.content))
+            response = Response(cbor.loads(resp.content))
     except (EOFError, ValueError) as e:
         pass
-    logger.error(f"Spacetime Response error {resp} with url {url}.")
-    return Response({
-        "error": f"Spacetime Response error {resp} with url {url}.",
-        "status": resp.status_code,
-        "url": url})
+    if response is None:
+        logger.error(f"Spacetime Response error {resp} with url {url}.")
+        response = Response({
+            "error": f"Spacetime Response error {resp} with url {url}.",
+            "status": resp.status_code,
+            "url": url,
+            "retry_after": resp.headers.get("Retry-After")})
+    metrics.record_download(url, response.status, len(resp.content))
+    return response
+
+def _fetch(url, config):
+    ''' The cache server's answer, retried as configured, or the last
+    connection error if every attempt failed. '''
+    host, port = config.cache_server
+    resp = None
+    for attempt in range(config.max_retries + 1):
+        if attempt:
+            time.sleep(backoff_delay(config, attempt))
+        try:
+            resp = get_session().get(
+                f"http://{host}:{port}/",
+                params=[("q", f"{url}"), ("u", f"{config.user_agent}")],
+                timeout=(config.connect_timeout, config.read_timeout))
+        except (requests.ConnectionError, requests.Timeout) as e:
+            resp = e
+            continue
+        if resp.status_code < 500:
+            break
+    return resp
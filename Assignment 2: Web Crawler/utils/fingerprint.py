@@ -0,0 +1,99 @@
+from array import array
+from hashlib import blake2b
+from threading import Lock
+from simhash import Simhash, SimhashIndex
+
+from utils import append_records, read_records
+from utils.seen import DigestSet
+
+
+class FingerprintIndex(object):
+    ''' Thread safe index of the content of every page kept so far. A page
+    is a duplicate if its words hash to the same 8 byte digest as an
+    earlier page, or if its simhash is within distance bits of one (0 only
+    catches exact copies).
+
+    Only pages whose completion is durable may be saved: after a crash,
+    a page that has to be downloaded again must not be a duplicate of
+    itself. add_if_new keeps a new page's fingerprint under its url until
+    commit(url), which the frontier calls as it logs the page complete,
+    and save appends the committed fingerprints to the file. '''
+    def __init__(self, distance=3):
+        self.distance = distance
+        self.lock = Lock()
+        self.exact = DigestSet()
+        # Simhash values in insertion order, the index is rebuilt from them.
+        self.simhashes = array("Q")
+        self.index = SimhashIndex([], k=distance)
+        # { url::str -> (digest::int, simhash::int) } of new pages not yet
+        # committed.
+        self.fresh = dict()
+        # digest, simhash pairs committed since the last save.
+        self.unsaved = array("Q")
+
+    def __len__(self):
+        return len(self.simhashes)
+
+    def _index(self, digest, simhash):
+        self.exact.add(digest)
+        if self.distance:
+            self.index.add(str(len(self.simhashes)), Simhash(simhash))
+            self.simhashes.append(simhash)
+
+    def add_if_new(self, words, url=None):
+        ''' Returns False if words is a duplicate of an indexed page,
+        otherwise indexes it and returns True. '''
+        text = " ".join(words)
+        digest = int.from_bytes(
+            blake2b(text.encode("utf-8"), digest_size=8).digest(), "big")
+        # Hashing every word is the expensive part, keep it out of the lock.
+        simhash = Simhash(words) if self.distance else None
+        with self.lock:
+            if digest in self.exact:
+                return False
+            self.exact.add(digest)
+            if simhash is not None:
+                if self.index.get_near_dups(simhash):
+                    return False
+                self.index.add(str(len(self.simhashes)), simhash)
+                self.simhashes.append(simhash.value)
+            if url is not None:
+                self.fresh[url] = (digest, simhash.value if simhash else 0)
+            return True
+
+    def commit(self, url):
+        ''' Marks the page of url complete, so the next save writes its
+        fingerprint. Returns (digest, simhash) to log with the completion,
+        or None if url added no new page. '''
+        with self.lock:
+            fingerprint = self.fresh.pop(url, None)
+            if fingerprint is not None:
+                self.unsaved.extend(fingerprint)
+            return fingerprint
+
+    def restore(self, digest, simhash):
+        ''' Indexes a page logged complete after the last save, unless the
+        file already has it. '''
+        with self.lock:
+            if digest in self.exact:
+                return
+            self._index(digest, simhash)
+            self.unsaved.extend((digest, simhash))
+
+    def save(self, path):
+        ''' Appends the fingerprints committed since the last save. '''
+        with self.lock:
+            unsaved, self.unsaved = self.unsaved, array("Q")
+        if unsaved:
+            append_records(path, unsaved)
+
+    @classmethod
+    def load(cls, path, distance=3):
+        fingerprints = cls(distance)
+        # A crash while appending can leave half a pair at the end; that
+        # page is still in the frontier log and restored from there.
+        values = read_records(path, "Q", 2)
+        for digest, simhash in zip(values[::2], values[1::2]):
+            if digest not in fingerprints.exact:
+                fingerprints._index(digest, simhash)
+        return fingerprints
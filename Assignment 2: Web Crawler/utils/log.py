@@ -0,0 +1,143 @@
+''' Logging for the crawler. Every logger from get_logger hands its records to
+one queue, and a single background thread writes them to the console and to
+Logs/<filename>.log. Threads logging a line therefore never wait on disk or
+on each other.
+
+Lines logged with extra={"sample": True}, the per url ones, are kept one in
+every LOGSAMPLE; the rest are always kept.
+'''
+import os
+import sys
+import atexit
+import logging
+import itertools
+
+from queue import SimpleQueue
+from threading import Lock
+from logging.handlers import QueueHandler, QueueListener
+
+FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+_settings = {
+    "console_level": logging.INFO, "file_level": logging.INFO, "sample": 1}
+# The queue and listener of the current process. A forked process starts
+# its own on first use, since the parent's listener thread is not copied.
+_pipeline = {"pid": None, "queue": None, "listener": None, "sinks": ()}
+_lock = Lock()
+# { name::str -> logging.Logger } set up by get_logger.
+_loggers = dict()
+
+
+class FileSink(logging.Handler):
+    ''' Writes each record to Logs/<record.log_file>.log. '''
+    def __init__(self, level):
+        super().__init__(level)
+        # { filename::str -> logging.FileHandler }
+        self.files = dict()
+
+    def emit(self, record):
+        handler = self.files.get(record.log_file)
+        if handler is None:
+            os.makedirs("Logs", exist_ok=True)
+            handler = logging.FileHandler(f"Logs/{record.log_file}.log")
+            handler.setFormatter(self.formatter)
+            self.files[record.log_file] = handler
+        handler.emit(record)
+
+    def close(self):
+        for handler in self.files.values():
+            handler.close()
+        super().close()
+
+
+class CrawlerQueueHandler(QueueHandler):
+    ''' Stamps records with the log file of their logger and drops all but
+    one in every sample of the per url lines. '''
+    def __init__(self, log_file):
+        super().__init__(None)
+        self.log_file = log_file
+        self.sampled = itertools.count()
+
+    def filter(self, record):
+        if getattr(record, "sample", False) and _settings["sample"] > 1:
+            if next(self.sampled) % _settings["sample"]:
+                return False
+        return super().filter(record)
+
+    def prepare(self, record):
+        record = super().prepare(record)
+        record.log_file = self.log_file
+        return record
+
+    def enqueue(self, record):
+        _queue().put(record)
+
+
+def _queue():
+    if _pipeline["pid"] != os.getpid():
+        with _lock:
+            if _pipeline["pid"] != os.getpid():
+                _start()
+    return _pipeline["queue"]
+
+
+def _start():
+    formatter = logging.Formatter(FORMAT)
+    console = logging.StreamHandler(sys.stderr)
+    console.setLevel(_settings["console_level"])
+    files = FileSink(_settings["file_level"])
+    for sink in (console, files):
+        sink.setFormatter(formatter)
+    queue = SimpleQueue()
+    listener = QueueListener(queue, console, files, respect_handler_level=True)
+    listener.start()
+    _pipeline.update(
+        pid=os.getpid(), queue=queue, listener=listener, sinks=(console, files))
+
+
+def stop_logging():
+    ''' Writes out every queued line and stops the listener of this process.
+    Logging again starts a new one. Processes that exit through os._exit,
+    such as multiprocessing children, must call this before returning. '''
+    with _lock:
+        if _pipeline["pid"] == os.getpid():
+            _pipeline["listener"].stop()
+            for sink in _pipeline["sinks"]:
+                sink.close()
+            _pipeline["pid"] = None
+
+atexit.register(stop_logging)
+
+
+def get_logger(name, filename=None):
+    ''' The logger called name, writing to Logs/<filename or name>.log.
+    Safe to call again for the same name. '''
+    with _lock:
+        if name in _loggers:
+            return _loggers[name]
+        logger = logging.getLogger(name)
+        logger.setLevel(min(_settings["console_level"], _settings["file_level"]))
+        logger.addHandler(CrawlerQueueHandler(filename if filename else name))
+        _loggers[name] = logger
+        return logger
+
+
+def _level(name):
+    level = logging.getLevelName(name.strip().upper())
+    if not isinstance(level, int):
+        raise ValueError(f"Unknown log level {name}.")
+    return level
+
+
+def configure_logging(config):
+    ''' Applies the LOGLEVEL, FILELOGLEVEL and LOGSAMPLE settings. '''
+    with _lock:
+        _settings["console_level"] = _level(config.console_log_level)
+        _settings["file_level"] = _level(config.file_log_level)
+        _settings["sample"] = max(1, config.log_sample)
+        if _pipeline["pid"] == os.getpid():
+            console, files = _pipeline["sinks"]
+            console.setLevel(_settings["console_level"])
+            files.setLevel(_settings["file_level"])
+        for logger in _loggers.values():
+            logger.setLevel(min(_settings["console_level"], _settings["file_level"]))
@@ -0,0 +1,155 @@
+''' Crawl instrumentation: counters, per-stage latency histograms and gauges
+in one process wide registry, exported as Prometheus text on a localhost
+/metrics endpoint and as a periodic JSON snapshot file. '''
+import os
+import json
+import time
+
+from bisect import bisect_left
+from contextlib import contextmanager
+from collections import defaultdict
+from threading import Lock, Thread
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+# Upper bounds, in seconds, of the latency histogram buckets.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Metrics(object):
+    def __init__(self):
+        self.lock = Lock()
+        self.started = time.time()
+        # { name::str -> { labels::tuple -> value::float } }
+        self.counters = defaultdict(lambda: defaultdict(float))
+        # { stage::str -> [count per bucket..., +Inf count, sum] }
+        self.stages = dict()
+        # { name::str -> function returning the current value }
+        self.gauges = dict()
+
+    def inc(self, name, value=1, **labels):
+        with self.lock:
+            self.counters[name][tuple(sorted(labels.items()))] += value
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            if stage not in self.stages:
+                self.stages[stage] = [0] * (len(BUCKETS) + 1) + [0.0]
+            histogram = self.stages[stage]
+            histogram[bisect_left(BUCKETS, seconds)] += 1
+            histogram[-1] += seconds
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def gauge(self, name, function):
+        self.gauges[name] = function
+
+    def record_download(self, url, status, size):
+        host = urlparse(url).netloc
+        self.inc("crawler_downloads_total", host=host)
+        self.inc("crawler_downloaded_bytes_total", size)
+        if status != 200:
+            self.inc("crawler_download_errors_total", host=host)
+
+    def _total(self, name):
+        return sum(self.counters[name].values()) if name in self.counters else 0
+
+    def prometheus(self):
+        lines = list()
+        with self.lock:
+            for name, values in sorted(self.counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                for labels, value in sorted(values.items()):
+                    lines.append(f"{name}{_labels(labels)} {value:g}")
+            lines.append("# TYPE crawler_stage_seconds histogram")
+            for stage, histogram in sorted(self.stages.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ("+Inf",), histogram):
+                    cumulative += count
+                    lines.append(
+                        f'crawler_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'crawler_stage_seconds_sum{{stage="{stage}"}} {histogram[-1]:g}')
+                lines.append(f'crawler_stage_seconds_count{{stage="{stage}"}} {cumulative}')
+        for name, function in sorted(self.gauges.items()):
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {function():g}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        now = time.time()
+        with self.lock:
+            elapsed = max(now - self.started, 1e-9)
+            pages = self._total("crawler_pages_total")
+            size = self._total("crawler_downloaded_bytes_total")
+            hosts = dict()
+            errors_by_host = self.counters.get("crawler_download_errors_total", {})
+            for labels, requests in self.counters.get("crawler_downloads_total", {}).items():
+                errors = errors_by_host.get(labels, 0)
+                hosts[dict(labels)["host"]] = {
+                    "requests": requests, "errors": errors,
+                    "error_rate": errors / requests}
+            stages = dict()
+            for stage, histogram in self.stages.items():
+                count = sum(histogram[:-1])
+                stages[stage] = {
+                    "count": count, "total_seconds": histogram[-1],
+                    "mean_seconds": histogram[-1] / count if count else 0,
+                    "buckets": dict(zip(map(str, BUCKETS + ("+Inf",)), histogram[:-1]))}
+        return {
+            "time": now, "uptime_seconds": elapsed,
+            "pages": pages, "bytes": size,
+            "pages_per_sec": pages / elapsed, "bytes_per_sec": size / elapsed,
+            "gauges": {name: function() for name, function in self.gauges.items()},
+            "stages": stages, "hosts": hosts}
+
+    def write_snapshot(self, path):
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(self.snapshot(), f, indent=1)
+        os.replace(f"{path}.tmp", path)
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+# The registry every module records into.
+metrics = Metrics()
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_exporters(config):
+    ''' Serves /metrics on localhost:METRICSPORT and writes METRICSFILE
+    every METRICSINTERVAL seconds, each only if configured. '''
+    if config.metrics_port:
+        server = ThreadingHTTPServer(("127.0.0.1", config.metrics_port), MetricsRequestHandler)
+        server.daemon_threads = True
+        Thread(target=server.serve_forever, daemon=True).start()
+    if config.metrics_file:
+        def write_snapshots():
+            while True:
+                time.sleep(config.metrics_interval)
+                metrics.write_snapshot(config.metrics_file)
+        Thread(target=write_snapshots, daemon=True).start()
@@ -0,0 +1,83 @@
+import codecs
+
+from collections import namedtuple
+from threading import local
+from bs4 import BeautifulSoup, UnicodeDammit
+from bs4.dammit import EncodingDetector
+
+try:
+    import lxml.html
+    from lxml.etree import ParserError
+except ImportError:
+    lxml = None
+
+# Everything the scraper needs from one page, from a single parse.
+#   hrefs: href attribute of every <a> tag, in document order.
+#   text: the text content of the page.
+ParsedPage = namedtuple("ParsedPage", ["hrefs", "text"])
+
+
+def parse_html_parser(content):
+    soup = BeautifulSoup(content, "html.parser")
+    hrefs = [a_tag.attrs.get("href") for a_tag in soup.find_all("a")]
+    return ParsedPage(hrefs, soup.text)
+
+
+# An lxml parser must not be shared between threads, so each keeps its own
+# { encoding::str -> lxml.html.HTMLParser } in parsers.
+lxml_parsers = local()
+
+
+def encoding_of(content):
+    ''' The encoding BeautifulSoup would decode content with. Without one
+    libxml2 reads undeclared UTF-8 as Latin-1. The declared encoding and
+    UTF-8 are tried before UnicodeDammit, which may run a slow charset
+    detector over the whole page. '''
+    encoding = EncodingDetector.find_declared_encoding(content, is_html=True)
+    if encoding:
+        try:
+            return codecs.lookup(encoding).name
+        except LookupError:
+            pass
+    try:
+        content.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError:
+        return UnicodeDammit(content, is_html=True).original_encoding
+
+
+def parse_lxml(content):
+    parser = None
+    if isinstance(content, bytes):
+        encoding = encoding_of(content)
+        if encoding:
+            parsers = getattr(lxml_parsers, "parsers", None)
+            if parsers is None:
+                parsers = lxml_parsers.parsers = dict()
+            parser = parsers.get(encoding)
+            if parser is None:
+                parser = parsers[encoding] = lxml.html.HTMLParser(encoding=encoding)
+    try:
+        root = lxml.html.fromstring(content, parser=parser)
+    except (ParserError, ValueError):
+        # Empty or undecodable documents, let the forgiving parser try.
+        return parse_html_parser(content)
+    hrefs = root.xpath("//a/@href")
+    # text_content() includes scripts and styles, which BeautifulSoup's text
+    # leaves out. drop_tree keeps the text that follows the element.
+    for element in root.xpath("//script|//style|//template"):
+        element.drop_tree()
+    return ParsedPage(hrefs, root.text_content())
+
+
+PARSERS = {"html.parser": parse_html_parser}
+if lxml:
+    PARSERS["lxml"] = parse_lxml
+
+
+def get_parser(name=None):
+    ''' Returns the parse function for name, or the fastest one installed.
+    Falls back to html.parser if the requested backend is not installed. '''
+    if name in PARSERS:
+        return PARSERS[name]
+    return PARSERS.get("lxml", parse_html_parser)
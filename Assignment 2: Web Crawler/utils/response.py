@@ -1,14 +1,115 @@
+import io
+import time
 import pickle
+import pickletools
+
+from email.utils import parsedate_to_datetime
 
 class Response(object):
+    ''' A page from the cache server. The pickled requests.Response in
+    raw_response is only unpickled the first time it is used; size,
+    content_type and content_length are read without unpickling it. '''
     def __init__(self, resp_dict):
         self.url = resp_dict["url"]
         self.status = resp_dict["status"]
         self.error = resp_dict["error"] if "error" in resp_dict else None
+        self._payload = resp_dict["response"] if "response" in resp_dict else None
+        # Retry-After of the cache server itself, when it refused the request.
+        self._retry_after = resp_dict["retry_after"] if "retry_after" in resp_dict else None
+        self._raw_response = None
+        self._decoded = False
+
+    @property
+    def raw_response(self):
+        if not self._decoded:
+            self._decoded = True
+            try:
+                self._raw_response = (
+                    pickle.loads(self._payload)
+                    if self._payload is not None else
+                    None)
+            except TypeError:
+                self._raw_response = None
+            # The pickle is no longer needed once decoded.
+            self._payload = None
+        return self._raw_response
+
+    @property
+    def size(self):
+        ''' Bytes of the pickled response, an upper bound on the body. '''
+        if isinstance(self._payload, (bytes, bytearray)):
+            return len(self._payload)
+        if self._raw_response is not None and self._raw_response.content:
+            return len(self._raw_response.content)
+        return 0
+
+    @property
+    def content_type(self):
+        ''' The media type, lower case and without parameters, or None if
+        the response has no Content-Type header. '''
+        value = self._header("content-type")
+        return value.split(";", 1)[0].strip().lower() if value else None
+
+    @property
+    def content_length(self):
+        value = self._header("content-length")
+        return int(value) if value and value.strip().isdigit() else None
+
+    @property
+    def retry_after(self):
+        ''' Seconds the server asked to wait before the next request, or
+        None. '''
+        value = self._retry_after or self._header("retry-after")
+        if not value:
+            return None
+        value = value.strip()
+        if value.isdigit():
+            return int(value)
         try:
-            self.raw_response = (
-                pickle.loads(resp_dict["response"])
-                if "response" in resp_dict else
-                None)
-        except TypeError:
-            self.raw_response = None
+            return max(0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def _header(self, name):
+        if self._decoded:
+            if self._raw_response is None:
+                return None
+            return self._raw_response.headers.get(name)
+        if not isinstance(self._payload, (bytes, bytearray)):
+            return None
+        return _peek_header(self._payload, name)
+
+
+def _peek_header(payload, name):
+    ''' The value of header name (lower case) in a pickled requests.Response,
+    without unpickling it. The headers are pickled as a dict of
+    lower case name -> (name, value) after the body, so the last occurrence
+    of the name as a pickled string is followed by the original name and
+    the value. Returns None when it cannot tell. '''
+    key = name.encode("utf-8")
+    found = payload.rfind(key)
+    while found > 0:
+        # The string opcode and its length come right before the text:
+        # 1 + 1 bytes for SHORT_BINUNICODE, 1 + 4 for BINUNICODE.
+        for header in (2, 5):
+            start = found - header
+            if start < 0:
+                continue
+            # BytesIO shares the payload's buffer instead of copying it.
+            data = io.BytesIO(payload)
+            data.seek(start)
+            strings = list()
+            try:
+                for opcode, arg, pos in pickletools.genops(data):
+                    if opcode.name in ("SHORT_BINUNICODE", "BINUNICODE", "UNICODE"):
+                        strings.append(arg)
+                    elif opcode.name not in ("MEMOIZE", "BINPUT", "LONG_BINPUT", "PUT"):
+                        break
+                    if len(strings) == 3:
+                        break
+            except ValueError:
+                continue
+            if len(strings) == 3 and strings[0] == name:
+                return strings[2]
+        found = payload.rfind(key, 0, found)
+    return None
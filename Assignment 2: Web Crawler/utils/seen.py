@@ -0,0 +1,168 @@
+import os
+import math
+import heapq
+import pickle
+
+from array import array
+from bisect import bisect_left
+from threading import Lock
+
+from utils import append_records, get_urldigest, read_records
+
+
+class BloomFilter(object):
+    ''' Fixed size Bloom filter over 64 bit digests. The k bit positions
+    come from double hashing the two 32 bit halves of the digest. '''
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, digest):
+        h1 = digest & 0xffffffff
+        h2 = (digest >> 32) | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def __contains__(self, digest):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(digest))
+
+    def add(self, digest):
+        for pos in self._positions(digest):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+
+class ScalableBloomFilter(object):
+    ''' Adds a filter twice the size, with a tighter error rate, whenever
+    the newest one is full, so the total false positive rate stays below
+    error_rate no matter how many digests are added. '''
+    def __init__(self, error_rate, initial_capacity=100000):
+        self.error_rate = error_rate
+        self.initial_capacity = initial_capacity
+        self.filters = list()
+
+    def __contains__(self, digest):
+        return any(digest in bloom for bloom in self.filters)
+
+    def add(self, digest):
+        if not self.filters or self.filters[-1].count >= self.filters[-1].capacity:
+            capacity = self.initial_capacity * 2 ** len(self.filters)
+            # Rates 1/2, 1/4, 1/8... of error_rate sum to at most error_rate.
+            error_rate = self.error_rate * 0.5 ** (len(self.filters) + 1)
+            self.filters.append(BloomFilter(capacity, error_rate))
+        self.filters[-1].add(digest)
+
+
+class DigestSet(object):
+    ''' Exact set of 64 bit digests, 8 bytes each: a sorted array searched
+    with bisect, plus a small set of recent additions merged into it once
+    it grows past a fraction of the array. '''
+    def __init__(self, digests=()):
+        self.sorted = array("Q", sorted(digests))
+        self.recent = set()
+
+    def __len__(self):
+        return len(self.sorted) + len(self.recent)
+
+    def __contains__(self, digest):
+        if digest in self.recent:
+            return True
+        i = bisect_left(self.sorted, digest)
+        return i < len(self.sorted) and self.sorted[i] == digest
+
+    def __iter__(self):
+        yield from self.sorted
+        yield from self.recent
+
+    def add(self, digest):
+        self.recent.add(digest)
+        if len(self.recent) > max(4096, len(self.sorted) >> 4):
+            self.sorted = array("Q", heapq.merge(self.sorted, sorted(self.recent)))
+            self.recent.clear()
+
+
+class SeenSet(object):
+    ''' Thread safe set of urls with bounded memory: roughly 8 bytes of
+    digest plus a few bytes of Bloom filter per url instead of the url
+    itself. The Bloom filter answers most lookups for new urls without
+    touching the digests, which stay the exact answer. Urls are identified
+    by utils.get_urldigest, so the scheme is ignored just like in the
+    frontier.
+
+    Saved as a snapshot plus the digests added after it, appended to
+    <path>.log. The snapshot is only rewritten once the log holds more
+    digests than it does, so each save costs about as much as what was
+    added since the last one. '''
+    def __init__(self, error_rate=0.001):
+        self.bloom = ScalableBloomFilter(error_rate)
+        self.digests = DigestSet()
+        self.lock = Lock()
+        # Digests added since the last save. None until the first save, so
+        # sets that are never saved keep nothing extra.
+        self.unsaved = None
+        # Digests in the log after the snapshot.
+        self.appended = 0
+
+    def __len__(self):
+        return len(self.digests)
+
+    def __contains__(self, url):
+        digest = int.from_bytes(get_urldigest(url), "big")
+        with self.lock:
+            return digest in self.bloom and digest in self.digests
+
+    def _add(self, digest):
+        if digest in self.bloom and digest in self.digests:
+            return False
+        self.bloom.add(digest)
+        self.digests.add(digest)
+        return True
+
+    def add(self, url):
+        ''' Returns True if url was not in the set before. '''
+        digest = int.from_bytes(get_urldigest(url), "big")
+        with self.lock:
+            if not self._add(digest):
+                return False
+            if self.unsaved is not None:
+                self.unsaved.append(digest)
+            return True
+
+    def save(self, path):
+        with self.lock:
+            unsaved, self.unsaved = self.unsaved, array("Q")
+            # The first save of a set writes a snapshot.
+            appended = self.appended + len(unsaved or ())
+            if (unsaved is not None and os.path.exists(path)
+                    and appended <= len(self) - appended):
+                self.appended = appended
+            else:
+                # Write aside and rename, so a crash never leaves half a
+                # file. A crash before the log is emptied only leaves
+                # digests the snapshot already has.
+                with open(f"{path}.tmp", "wb") as f:
+                    pickle.dump((self.bloom, self.digests), f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(f"{path}.tmp", path)
+                open(f"{path}.log", "wb").close()
+                self.appended = 0
+                return
+        if unsaved:
+            append_records(f"{path}.log", unsaved)
+
+    @classmethod
+    def load(cls, path, error_rate=0.001):
+        seen = cls(error_rate)
+        with open(path, "rb") as f:
+            seen.bloom, seen.digests = pickle.load(f)
+        # Urls whose digest was cut off by a crash are still in the
+        # frontier log.
+        appended = read_records(f"{path}.log", "Q")
+        for digest in appended:
+            seen._add(digest)
+        seen.appended = len(appended)
+        seen.unsaved = array("Q")
+        return seen
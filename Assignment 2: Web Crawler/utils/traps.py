@@ -0,0 +1,148 @@
+import os
+import re
+import pickle
+
+from array import array
+from collections import Counter
+from hashlib import blake2b
+from threading import Lock
+from urllib.parse import urlsplit
+
+from utils import append_records, read_records
+from utils.log import get_logger
+from utils.metrics import metrics
+
+DIGITS = re.compile(r"\d+")
+
+
+def template(url, parsed=None):
+    ''' The url with its variable parts generalized: digit runs in the path
+    (ids, pages, dates) become <n>, long mixed ids become <id>, and the
+    query keeps only its sorted parameter names.
+    "https://h/events/2020-01-05/p3?b=1&a=2" -> "h/events/<n>-<n>-<n>/p<n>?a&b" '''
+    if parsed is None:
+        parsed = urlsplit(url)
+    segments = list()
+    for segment in parsed.path.lower().split("/"):
+        if len(segment) >= 16 and DIGITS.search(segment):
+            segments.append("<id>")
+        else:
+            segments.append(DIGITS.sub("<n>", segment))
+    keys = sorted({pair.partition("=")[0] for pair in parsed.query.split("&") if pair})
+    return f"{parsed.netloc.lower()}{'/'.join(segments)}?{'&'.join(keys)}"
+
+
+class TrapDetector(object):
+    ''' Thread safe detection of crawler traps from the urls themselves.
+
+    A path with a segment repeated repeat times or more (/a/b/a/b/a/b) is a
+    loop and rejected. Every other url is counted under its template().
+    Once samples pages of a template were downloaded, the share of them
+    that were new (not duplicates, enough text) decides how many more urls
+    it may add: up to max_urls while every page is new, proportionally
+    fewer as that share falls, and none once it is below novelty.
+
+    Only counts are kept, as { 8 byte digest of the template::int ->
+    [urls admitted::int, pages downloaded::int, new pages::int] }. They
+    are saved as a snapshot plus the templates changed after it, appended
+    to <path>.log, where the last record of a template wins. The snapshot
+    is only rewritten once the log holds twice as many records as there
+    are templates. '''
+    def __init__(self, samples=20, novelty=0.1, max_urls=1000, repeat=3):
+        self.samples = samples
+        self.novelty = novelty
+        self.max_urls = max_urls
+        self.repeat = repeat
+        self.lock = Lock()
+        self.templates = dict()
+        # Templates already logged as limited in this run.
+        self.reported = set()
+        # Templates changed since the last save, and the records in the log
+        # after the snapshot.
+        self.changed = set()
+        self.appended = 0
+        self.logger = get_logger("TRAPS")
+
+    def __len__(self):
+        return len(self.templates)
+
+    @staticmethod
+    def _key(url, parsed=None):
+        return int.from_bytes(
+            blake2b(template(url, parsed).encode("utf-8"), digest_size=8).digest(), "big")
+
+    def admit(self, url, parsed=None, record=True):
+        ''' False if url looks like part of a trap, otherwise counts it
+        against its template and returns True. With record False, url was
+        counted when it was first found: it is only checked against the
+        template's current allowance, and not counted again. '''
+        if parsed is None:
+            parsed = urlsplit(url)
+        segments = [segment for segment in parsed.path.split("/") if segment]
+        if segments and max(Counter(segments).values()) >= self.repeat:
+            metrics.inc("crawler_trap_rejected_total", reason="loop")
+            return False
+        key = self._key(url, parsed)
+        with self.lock:
+            stats = self.templates.setdefault(key, [0, 0, 0])
+            admitted, fetched, novel = stats
+            allowance = self.max_urls
+            if fetched >= self.samples:
+                share = novel / fetched
+                allowance = 0 if share < self.novelty else (
+                    self.samples + (self.max_urls - self.samples) * share)
+            if admitted > allowance or (record and admitted == allowance):
+                if key not in self.reported:
+                    self.reported.add(key)
+                    self.logger.info(
+                        f"Limiting {template(url, parsed)} after {admitted} urls, "
+                        f"{novel} of {fetched} downloaded pages were new.")
+                metrics.inc("crawler_trap_rejected_total", reason="template")
+                return False
+            if record:
+                stats[0] += 1
+                self.changed.add(key)
+            return True
+
+    def record(self, url, novel):
+        ''' Counts a downloaded page of url's template, novel if it added
+        new content. '''
+        key = self._key(url)
+        with self.lock:
+            stats = self.templates.setdefault(key, [0, 0, 0])
+            stats[1] += 1
+            if novel:
+                stats[2] += 1
+            self.changed.add(key)
+
+    def save(self, path):
+        records = array("Q")
+        with self.lock:
+            appended = self.appended + len(self.changed)
+            if os.path.exists(path) and appended <= 2 * len(self.templates):
+                for key in self.changed:
+                    records.append(key)
+                    records.extend(self.templates[key])
+                self.appended = appended
+            else:
+                with open(f"{path}.tmp", "wb") as f:
+                    pickle.dump(self.templates, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(f"{path}.tmp", path)
+                open(f"{path}.log", "wb").close()
+                self.appended = 0
+            self.changed.clear()
+        if records:
+            append_records(f"{path}.log", records)
+
+    @classmethod
+    def load(cls, path, *args, **kwargs):
+        traps = cls(*args, **kwargs)
+        with open(path, "rb") as f:
+            traps.templates = pickle.load(f)
+        # Changes cut off by a crash are lost, which only lets a template
+        # add a few more urls.
+        records = read_records(f"{path}.log", "Q", 4)
+        for i in range(0, len(records), 4):
+            traps.templates[records[i]] = records[i + 1:i + 4].tolist()
+        traps.appended = len(records) // 4
+        return traps
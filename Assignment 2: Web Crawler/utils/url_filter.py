@@ -0,0 +1,91 @@
+import re
+from urllib.parse import urlsplit
+
+
+class DomainTrie(object):
+    ''' Suffix trie over reversed host labels ("www.ics.uci.edu" is stored
+    as edu -> uci -> ics -> www), so a lookup costs one dict step per label
+    and only matches whole labels. '''
+    def __init__(self):
+        self.root = dict()
+
+    def add(self, domain, value):
+        node = self.root
+        for label in reversed(domain.lower().split(".")):
+            node = node.setdefault(label, dict())
+        # The None key holds the value of a domain ending at this node.
+        node[None] = value
+
+    def match(self, host):
+        ''' Value of the longest registered domain that host is, or is a
+        subdomain of. None if there is no such domain. '''
+        node = self.root
+        found = None
+        for label in reversed(host.split(".")):
+            node = node.get(label)
+            if node is None:
+                break
+            found = node.get(None, found)
+        return found
+
+
+class UrlFilter(object):
+    ''' The static is_valid rules compiled once, so checking a url is a few
+    dict and set lookups plus two precompiled regex searches.
+
+    domains: allowed hosts, including their subdomains. An entry can carry a
+        path ("today.uci.edu/department/x") to allow only that part of a host.
+    denied_domains: hosts (and subdomains) rejected even if under an allowed
+        domain.
+    extensions: file extensions, without the dot, that are never crawled.
+    query_blacklist: rejected if any of these appear in the query string.
+    path_blacklist: rejected if any of these appear in the lowercased url.
+    '''
+    def __init__(self, domains, denied_domains=(), extensions=(),
+            query_blacklist=(), path_blacklist=(), max_length=150):
+        self.max_length = max_length
+        self.domains = DomainTrie()
+        prefixes = dict()
+        for domain in domains:
+            host, _, path = domain.partition("/")
+            prefixes.setdefault(host, list()).append("/" + path if path else "")
+        for host, paths in prefixes.items():
+            self.domains.add(host, tuple(paths))
+        for host in denied_domains:
+            # No allowed path prefixes means every path is rejected.
+            self.domains.add(host, tuple())
+        self.extensions = frozenset(ext.lower() for ext in extensions)
+        self.query_blacklist = self._compile(query_blacklist)
+        self.path_blacklist = self._compile(path_blacklist)
+
+    @staticmethod
+    def _compile(substrings):
+        if not substrings:
+            return None
+        return re.compile("|".join(re.escape(s) for s in sorted(substrings)))
+
+    def allows(self, url, parsed=None):
+        ''' url must already have its fragment removed. parsed is its
+        urlparse/urlsplit result, if the caller already has one. '''
+        if len(url) > self.max_length:
+            return False
+        if parsed is None:
+            parsed = urlsplit(url)
+        if parsed.scheme not in ("http", "https"):
+            return False
+        if self.query_blacklist and self.query_blacklist.search(parsed.query):
+            return False
+        # Same as parsed.hostname, without the overhead of the property.
+        host = parsed.netloc.rpartition("@")[2].partition(":")[0].lower()
+        if not host:
+            return False
+        paths = self.domains.match(host.rstrip("."))
+        if not paths or not any(parsed.path.startswith(p) for p in paths):
+            return False
+        if self.path_blacklist and self.path_blacklist.search(url.lower()):
+            return False
+        path = parsed.path.lower()
+        dot = path.rfind(".")
+        if dot != -1 and path[dot + 1:] in self.extensions:
+            return False
+        return True
@@ -1,12 +1,24 @@
 from nltk.stem.snowball import SnowballStemmer
-from nltk.tokenize import word_tokenize
 from math import log
+import importlib.util
 import time
 import json
+import os
+
+# The Assignment 4 indexer, whose tokenizer and stem cache queries must go through too.
+INDEXER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, "Assignment 4")
+
+
+def load_module(name):
+	path = os.path.join(INDEXER_DIR, name + ".py")
+	spec = importlib.util.spec_from_file_location(name, path)
+	module = importlib.util.module_from_spec(spec)
+	spec.loader.exec_module(module)
+	return module
 
 
 class Search:
-	def __init__(self, index_file, lookup_table_file, byte_offset_table, limit, debug):
+	def __init__(self, index_file, lookup_table_file, byte_offset_table, limit, debug, tokenizer=None):
 		self.debug = debug
 
 		self.log = open(index_file)
@@ -17,7 +29,17 @@ class Search:
 		with open(byte_offset_table, "r") as f:
 			self.byte_offset_table = json.load(f)
 
+		# The same tokenizer the index was built with.
+		tokenizers = load_module("tokenizer")
+		self.tokenizer = tokenizers.get_tokenizer(tokenizer or tokenizers.TOKENIZER)
+
 		self.ss = SnowballStemmer(language="english")
+
+		# Starts with the stems the indexer saved next to the index, so common query words are not stemmed again.
+		stemming = load_module("stemming")
+		self.stem_file = os.path.join(os.path.dirname(index_file), stemming.STEM_FILE)
+		self.stems = stemming.StemCache.load(self.stem_file, self.ss)
+
 		self.limit = limit
 
 	def poop(self, token, results):
@@ -50,14 +72,17 @@ class Search:
 				end = time.perf_counter()
 				print("START - Time taken to retrieve query: {} ms.\n".format((end - start) * 1000))
 
+		if self.debug:
+			print("START - Stem cache: {}".format(self.stems.stats()))
+		self.stems.save(self.stem_file)
+
 		self.log.close()
 
 
 	def tokenize(self, text):
 		tokens = []
-		for token in word_tokenize(text):
-			if token.isalnum():
-				tokens.append(self.ss.stem(token.lower()))
+		for token in self.tokenizer.tokens(text):
+			tokens.append(self.stems.stem(token.lower()))
 
 		if self.debug:
 			print("TOKENIZE - Tokens: {}".format(tokens))
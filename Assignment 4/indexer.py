@@ -1,30 +1,63 @@
 from nltk.stem.snowball import SnowballStemmer
-from nltk.tokenize import word_tokenize
-from collections import defaultdict
-from bs4 import BeautifulSoup
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby, islice
+from bs4 import BeautifulSoup, CData, NavigableString, Tag
 import os
 import json
+import heapq
 import time
-import nltk
 from math import log
 import re
 from simhash import Simhash, SimhashIndex
-nltk.download("punkt")
+from stemming import StemCache, STEM_FILE
+from tokenizer import get_tokenizer, TOKENIZER
+
+# Tags whose text gets extra weight, categorized by importance. Only the first element of each tag counts.
+WEIGHTED_TAGS = [["title", "h1"], ["a", "b", "strong", "h2", "h3", "h4", "h5", "h6"]]
+
+# { group::int -> ( flat::int, multiplier::int ) }
+WEIGHTS = {0: (5, 3), 1: (2.5, 1.5)}
+
+# Low content tags, skipped entirely.
+SKIPPED_TAGS = {"style", "script"}
+
+# The strings get_text() joins: comments, doctypes and the like are left out.
+TEXT_TYPES = {NavigableString, CData}
+
+# Threshhold value representing when to offload the index to a partial index on disk.
+DUMP_THRESHOLD = 15000
+
+# Buckets of the index, in the order they are written to the index file.
+BUCKETS = "abcdefghijklmnopqrstuvwxyz+"
+
+# Bytes read ahead from each partial index while final merges them.
+MERGE_BUFFER = 64 * 1024
 
 
 
 
 class Indexer:
-    def __init__(self, dataset_path, index_file, lookup_table_file, byte_offset_table, debug):
+    def __init__(self, dataset_path, index_file, lookup_table_file, byte_offset_table, debug, partial_dir=".", tokenizer=TOKENIZER):
         self.dataset_path = dataset_path
         self.index_file = index_file
         self.lookup_table_file = lookup_table_file
         self.byte_offset_table = byte_offset_table
         self.debug = debug
 
+        # Folder the partial index files are offloaded to.
+        self.partial_dir = partial_dir
+
+        # Splits text into alphanumeric tokens, see tokenizer.py. The search has to use the same one.
+        self.tokenizer = get_tokenizer(tokenizer)
+
         # This is the Porter2 stemmer.
         self.ss = SnowballStemmer(language="english")
 
+        # Saved next to the index so the search starts with the stems of common words already known.
+        self.stem_file = os.path.join(os.path.dirname(index_file), STEM_FILE) if index_file else None
+        self.stems = StemCache.load(self.stem_file, self.ss) if self.stem_file else StemCache(self.ss)
+
         # Total number of unique documents found.
         self.doc_id = 1
 
@@ -52,22 +85,28 @@ class Indexer:
 
         self.duplicates = []
 
+        # Partial index files written by dump, oldest first.
+        self.runs = []
+
 
-    def start(self):
+    def start(self, workers=1):
  
-        if debug: 
+        if self.debug: 
             start = time.perf_counter()
             print("START - Starting program...")
 
-        # Go through each folder in the provided dataset folder.
-        for subdir, dirs, files in os.walk(self.dataset_path):
-            # Go through each file in the folder.
-            for name in files:
-                self.process(subdir + os.sep + name)
+        # Every file in every folder of the provided dataset folder.
+        file_paths = (subdir + os.sep + name for subdir, dirs, files in os.walk(self.dataset_path) for name in files)
+
+        if workers > 1:
+            self.process_parallel(file_paths, workers)
+        else:
+            for file_path in file_paths:
+                self.process(file_path)
 
         self.final()
 
-        if debug:
+        if self.debug:
             end = time.perf_counter()
             print("START - Indexed {} out of {} documents ".format(self.doc_id, self.total))
             print("START - Total number of tokens: {}".format(self.num_tokens))
@@ -76,152 +115,198 @@ class Indexer:
     def process(self, file_path):
 
         with open(file_path, "r") as f:
-            self.total += 1
-
             file = json.load(f)
-            url = file["url"]
-
-            # Defrag the URL to prevent visting the same document twice.
-            if url.find("#") != -1:
-                url = url[:url.find("#")]
 
-            # Check whether the URL has been visited.
-            if url not in self.visited:
-                self.lookup_table[self.doc_id] = url
+        self.process_document(file["url"], file["content"])
+
+    def process_parallel(self, file_paths, workers, batch_size=64):
+        # Analyzes batches of files in worker processes and merges the results here in dataset order,
+        # so doc ids, duplicate checks and the index come out exactly as in a serial build.
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(self.tokenizer.name,)) as executor:
+            # Bounded so finished batches do not pile up in memory while the merge catches up.
+            pending = deque()
+            for batch in iter(lambda: list(islice(file_paths, batch_size)), []):
+                pending.append(executor.submit(analyze_files, batch))
+                if len(pending) >= workers * 4:
+                    self.merge_batch(pending.popleft().result())
+            while pending:
+                self.merge_batch(pending.popleft().result())
+
+    def merge_batch(self, batch):
+        results, stem_update = batch
+        self.stems.merge(stem_update)
+        for url, analysis in results:
+            self.merge_document(url, analysis=analysis)
+
+    def process_document(self, url, content):
+        # Indexes one page, either read from the dataset by process or handed over by the crawler.
+        self.merge_document(url, content=content)
+
+    def merge_document(self, url, analysis=None, content=None):
+        # Adds one page to the index, given its content or the result of analyze(content).
+        self.total += 1
+        original_url = url
+
+        # Defrag the URL to prevent visting the same document twice.
+        if url.find("#") != -1:
+            url = url[:url.find("#")]
+
+        # Check whether the URL has been visited.
+        if url not in self.visited:
+            self.lookup_table[self.doc_id] = url
+
+            if analysis is None:
+                analysis = self.analyze(content)
+            fingerprint, token_freq = analysis
+
+            # Creating simhash of pages to check for near/exact duplicates
+            index = Simhash(fingerprint)
+            ifDuplicate = True
+            if not self.hashes:
+                self.hashes = SimhashIndex([(str(self.total), index)], k=2)
+            else:
+                ifDuplicate = self.hashes.get_near_dups(index)
+                self.hashes.add(str(self.total), index)
+            if not ifDuplicate or self.total == 1:
+
+                # Combine the current document's inverted index to the main inverted index.
+                for token_letter, token_freq_dict in token_freq.items():
+                    for token, freq in token_freq_dict.items():
+                        self.index[token_letter][token][self.doc_id] = freq
+
+                if self.debug:
+                    print("PROCESS - Document: {}, URL: {}".format(self.doc_id, original_url))
+
+                self.doc_id += 1
+                self.visited.add(url)
+                self.processed += 1
+
+                if self.processed > DUMP_THRESHOLD:
+                    self.dump()
+
+    def analyze(self, content):
+        # Everything about a document that does not depend on the rest of the index, so it can run in a worker process.
+        # Returns ( simhash::int, { starting_char::str -> { token::str -> weighted freq::float } } ).
+
+        # Parse the document using BS4.
+        soup = BeautifulSoup(content, "html.parser")
+
+        text, tag_text = self.extract(soup)
+
+        fingerprint = Simhash(self.get_features(text)).value
 
-                # Parse the document using BS4.
-                soup = BeautifulSoup(file["content"], "html.parser")
-
-                # Remove low content tags.
-                for elem in soup(['style', 'script']):
-                    elem.extract()
-
-                # Creating simhash of pages to check for near/exact duplicates
-                index = Simhash(self.get_features(soup.get_text()))
-                ifDuplicate = True
-                if not self.hashes:
-                    self.hashes = SimhashIndex([(str(self.total), index)], k=2)
+        # { starting_char::str -> { token::str -> freq::int } }
+        token_freq = self.get_token_freq(text)
+
+        # Set containing tokens to prevent changing the weight group of a token on the second encounter.
+        seen = set()
+
+        for group in range(len(WEIGHTED_TAGS)):
+            for tag in WEIGHTED_TAGS[group]:
+                # The tag was not found and can be skipped.
+                if tag not in tag_text:
+                    continue
+
+                for token in self.tokenize(tag_text[tag]):
+                    if token not in seen:
+                        bucket = token[0]
+                        f, m = WEIGHTS[group]
+
+                        if bucket in self.alpha:
+                            # Add a base weight to the frequency.
+                            token_freq[bucket][token] += f
+                            # Add a multiplier weight to the frequency.
+                            token_freq[bucket][token] *= m
+                        else:
+                            token_freq["+"][token] += f
+                            token_freq["+"][token] *= m
+
+                        seen.add(token)
+
+        # Plain dicts, in the same order, so the result can be sent between processes.
+        return fingerprint, {bucket: dict(freqs) for bucket, freqs in token_freq.items()}
+
+    def extract(self, soup):
+        # Walks the parse tree once, skipping style and script, and returns the same text as soup.get_text() would
+        # along with { tag::str -> text::str } of the first element of each weighted tag, as soup.find(tag).get_text().
+        weighted = {tag for group in WEIGHTED_TAGS for tag in group}
+
+        strings = []
+
+        # { tag::str -> [ start::int, end::int ] } range in strings of the first element of each weighted tag.
+        spans = dict()
+
+        # Each entry is the weighted tag an element starts, or None, and an iterator over its remaining children.
+        stack = [(None, iter(soup.contents))]
+        while stack:
+            tag, children = stack[-1]
+            child = next(children, None)
+            if child is None:
+                # Done with this element and everything under it.
+                stack.pop()
+                if tag is not None:
+                    spans[tag][1] = len(strings)
+            elif isinstance(child, Tag):
+                if child.name in SKIPPED_TAGS:
+                    continue
+                if child.name in weighted and child.name not in spans:
+                    spans[child.name] = [len(strings), None]
+                    stack.append((child.name, iter(child.contents)))
                 else:
-                    ifDuplicate = self.hashes.get_near_dups(index)
-                    self.hashes.add(str(self.total), index)
-                if not ifDuplicate or self.total == 1:
-
-                    # { starting_char::str -> { token::str -> freq::int } }
-                    token_freq = self.get_token_freq(soup.get_text())
-
-                    # Set containing tokens to prevent changing the weight group of a token on the second encounter.
-                    seen = set()
-
-                    # List of tags categorized by importance.
-                    weighted_tags = [["title", "h1"], ["a", "b", "strong", "h2", "h3", "h4", "h5", "h6"]]
-
-                    # { group::int -> ( flat::int, multiplier::int ) }
-                    weights = {0: (5, 3), 1: (2.5, 1.5)}
+                    stack.append((None, iter(child.contents)))
+            elif type(child) in TEXT_TYPES:
+                strings.append(child)
 
-                    # Go through each tag and parse for tokens.
-                    for group in range(len(weighted_tags)):
-                        for tag in weighted_tags[group]:
-                            res = soup.find(tag)
-
-                            # The tag was not found and can be skipped.
-                            if not res:
-                                continue
-
-                            # List containing all tokens found for a specific tag.
-                            token_list = self.tokenize(soup.find(tag).get_text())
-
-                            for token in token_list:
-                                if token not in seen:
-                                    bucket = token[0]
-                                    f, m = weights[group]
-
-                                    if bucket in self.alpha:
-                                        # Add a base weight to the frequency.
-                                        token_freq[bucket][token] += f
-                                        # Add a multiplier weight to the frequency.
-                                        token_freq[bucket][token] *= m
-                                    else:
-                                        token_freq["+"][token] += f
-                                        token_freq["+"][token] *= m
-
-                                    seen.add(token)
-
-                    # Combine the current document's inverted index to the main inverted index.
-                    for token_letter, token_freq_dict in token_freq.items():
-                        for token, freq in token_freq_dict.items():
-                            self.index[token_letter][token][self.doc_id] = freq
-
-                    if debug:
-                        print("PROCESS - Document: {}, URL: {}".format(self.doc_id, file["url"]))
-
-                    self.doc_id += 1
-                    self.visited.add(url)
-                    self.processed += 1
-
-                    # Threshhold value representing when to offload the index to partial indices on disk.
-                    if self.processed > 15000:
-                        self.dump()
+        return "".join(strings), {tag: "".join(strings[start:end]) for tag, (start, end) in spans.items()}
 
     def get_token_freq(self, text):
         # { starting_char::str -> { token::str -> freq::int } }
         token_freq = defaultdict(lambda: defaultdict(int))
-        # This is a tokenize function from nltk library that returns a list of tokens.
-        token_list = word_tokenize(text)
-        for token in token_list:
-            if token.isalnum():
-                # Separate tokens into different buckets depending on starting character.
-                if token[0].lower() in self.alpha:
-                    # Convert the token to lowercase and stem it.
-                    token_freq[token[0].lower()][self.ss.stem(token.lower())] += 1
-                else:
-                    # All other characters will go into a separate bucket.
-                    token_freq["+"][self.ss.stem(token.lower())] += 1
+        for token in self.tokenizer.tokens(text):
+            # Separate tokens into different buckets depending on starting character.
+            if token[0].lower() in self.alpha:
+                # Convert the token to lowercase and stem it.
+                token_freq[token[0].lower()][self.stems.stem(token.lower())] += 1
+            else:
+                # All other characters will go into a separate bucket.
+                token_freq["+"][self.stems.stem(token.lower())] += 1
         return token_freq
 
     def tokenize(self, text):
-        # This is a tokenize function from nltk library that returns a list of tokens.
-        token_list = word_tokenize(text)
-        # Convert each token to it's lower case stem.
-        token_list = list(map(lambda token: self.ss.stem(token.lower()), token_list))
-        # Keep only alphanumeric tokens.
-        return filter(lambda token: token.isalnum(), token_list)
+        # Convert each token to it's lower case stem, then keep only the alphanumeric stems. Filtering after stemming
+        # keeps contractions such as 'll, which stem to ll.
+        return filter(str.isalnum, map(lambda token: self.stems.stem(token.lower()), self.tokenizer.words(text)))
 
 
     def dump(self):
-        if debug:
-            print("DUMP - Writing information to files.")
-
-        for char, token_freq in self.index.items():
-            # The name of the partial index file on disk to be offloaded to.
-            filename = "partial_index_" + char + ".json"
-            try:
-                with open(filename, "r+") as file:
-                    # Load the partial index file from disk and combine it with the one in memory.
-                    j = json.load(file)
-                    for t, freq in j.items():
-                        if t in token_freq:
-                            token_freq[t].update(freq)
-                        else:
-                            token_freq[t] = freq
-
-                # Create the partial index file and dump the combined partial index.
-                with open(filename, "w+") as f:
-                    if debug:
-                        print("DUMP - Merging index with {}".format(filename))
-                    json.dump(token_freq, f)
-
-            except FileNotFoundError:
-                filename = "partial_index_" + char + ".json"
-                if debug:
-                    print("DUMP - Creating file: {}".format(filename))
-                # Create the file and dump the partial index.
-                with open(filename, "w+") as f:
-                    json.dump(token_freq, f)
-            
+        # Offloads the index in memory to a new partial index file, one [ bucket, token, { doc_id -> freq } ] per line
+        # sorted by bucket and then token. A partial index is never opened again until final merges them all.
+        if self.index:
+            filename = os.path.join(self.partial_dir, "partial_index_{}.txt".format(len(self.runs)))
+            if self.debug:
+                print("DUMP - Writing information to {}".format(filename))
+
+            with open(filename, "w+") as f:
+                for char in BUCKETS:
+                    if char not in self.index:
+                        continue
+                    token_freq = self.index[char]
+                    for token in sorted(token_freq):
+                        f.write(json.dumps([char, token, token_freq[token]]))
+                        f.write("\n")
+            self.runs.append(filename)
 
         self.processed = 0
         self.index =  defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
 
+    def read_partial_index(self, filename):
+        # Yields the lines of a partial index one at a time, with the position of their bucket in BUCKETS first so
+        # they sort the way they were written.
+        with open(filename, "r", buffering=MERGE_BUFFER) as f:
+            for line in f:
+                char, token, did_freq = json.loads(line)
+                yield BUCKETS.index(char), token, did_freq
+
     def calculate_tf_idf(self, freq, length):
         # 1 + log( token frequency )
         tf = 1 + log( freq )
@@ -232,66 +317,71 @@ class Indexer:
     def final(self):
         # Dump the lookup table in memory to a file on disk.
         with open(self.lookup_table_file, "w+") as file:
-            if debug:
+            if self.debug:
                 print("FINAL - Dumping lookup_table to {}".format(self.lookup_table_file))
 
             json.dump(self.lookup_table, file)
 
-        # Dump any remaining index in memory to it's respective partial index file.
+        if self.debug:
+            print("FINAL - Stem cache: {}".format(self.stems.stats()))
+        self.stems.save(self.stem_file)
+
+        # Dump any remaining index in memory to a last partial index file.
         self.dump()
 
         # { token::str -> byte_offset::int }
         offset_dict = {}
 
-        if debug:
+        if self.debug:
             print("FINAL - Merging indexes...")
 
         print(self.duplicates)
 
+        # Merge the partial indexes, which are each sorted, by reading them side by side. Only the current token
+        # of each partial index is in memory, whatever the size of the index.
+        entries = heapq.merge(*map(self.read_partial_index, self.runs), key=lambda entry: entry[:2])
+
         # Create the final index file for appending, does not load the entire file into memory.
         with open(self.index_file, "a+") as f_idx:
             # Get the current byte offset.
             curr_offset = f_idx.tell()
 
-            # Go through each partial index bucket.
-            for char in 'abcdefghijklmnopqrstuvwxyz+':
-                filename = "partial_index_" + char + ".json"
-
-                with open(filename, "r") as f:
-                    # Load the partial index into memory.
-                    bucket = json.load(f)
-
-
-                    # The partial indexes stored on disk are in the form { token::str -> { doc_id:: int -> freq::int } } }.
-                    # Given the total number of documents has now been recognized, update the frequency to tf-idf score.
-                    for token, did_freq in bucket.items():
-                        # { token::str -> { doc_id:: int -> tf-idf score::int } } }
-                        current = defaultdict(lambda: defaultdict(int))
-                        # { doc_id:: int -> freq::int }
-                        for did, freq in did_freq.items():
-                            # Convert each frequency into a tf-idf score and store it.
-                            if not freq:
-                                current[token][did] = self.calculate_tf_idf(1, len(did_freq))
-                            else:
-                                current[token][did] = self.calculate_tf_idf(freq, len(did_freq))
-                        
-                        self.num_tokens += 1
-
-                        # Write the updated partial index in memory to the index file on disk.
-                        f_idx.write(json.dumps(current))
-                        f_idx.write("\n")
-
-                        # Record the byte offset pointing to the current token.
-                        offset_dict[token] = curr_offset
-                        # Update the byte offset.
-                        curr_offset = f_idx.tell()
-
-                # Remove the partial index from disk.
-                os.remove(filename)
+            for (rank, token), token_entries in groupby(entries, key=lambda entry: entry[:2]):
+                # The partial indexes were written in doc_id order, and merge keeps that order for the same token.
+                # { doc_id:: int -> freq::int }
+                did_freq = {}
+                for entry in token_entries:
+                    did_freq.update(entry[2])
+
+                # Given the total number of documents has now been recognized, update the frequency to tf-idf score.
+                # { token::str -> { doc_id:: int -> tf-idf score::int } } }
+                current = defaultdict(lambda: defaultdict(int))
+                for did, freq in did_freq.items():
+                    # Convert each frequency into a tf-idf score and store it.
+                    if not freq:
+                        current[token][did] = self.calculate_tf_idf(1, len(did_freq))
+                    else:
+                        current[token][did] = self.calculate_tf_idf(freq, len(did_freq))
+
+                self.num_tokens += 1
+
+                # Write the token's postings to the index file on disk.
+                f_idx.write(json.dumps(current))
+                f_idx.write("\n")
+
+                # Record the byte offset pointing to the current token.
+                offset_dict[token] = curr_offset
+                # Update the byte offset.
+                curr_offset = f_idx.tell()
+
+        # Remove the partial indexes from disk.
+        for filename in self.runs:
+            os.remove(filename)
+        self.runs = []
 
         # Dump the byte offset table in memory to a file on disk.
         with open(self.byte_offset_table, "w+") as file:
-            if debug:
+            if self.debug:
                 print("FINAL - Dumping byte_offset_table to {}".format(self.byte_offset_table))
             json.dump(offset_dict, file)
 
@@ -302,6 +392,24 @@ class Indexer:
         return [s[i:i + width] for i in range(max(len(s) - width + 1, 1))]
 
 
+# The Indexer each worker process of Indexer.process_parallel analyzes documents with.
+worker_indexer = None
+
+def init_worker(tokenizer):
+    global worker_indexer
+    worker_indexer = Indexer(None, None, None, None, False, tokenizer=tokenizer)
+
+def analyze_files(file_paths):
+    # Reads and analyzes a batch of dataset files in a worker process.
+    results = []
+    for file_path in file_paths:
+        with open(file_path, "r") as f:
+            file = json.load(f)
+        results.append((file["url"], worker_indexer.analyze(file["content"])))
+    # New stems go back with the batch so the merging process can save them.
+    return results, worker_indexer.stems.export()
+
+
 if __name__ == '__main__':
     # The name of the folder containing the provided dataset.
     dataset_path = "DEV"
@@ -313,5 +421,8 @@ if __name__ == '__main__':
 
     debug = True
 
+    # Number of processes analyzing documents, 1 to index in this process only.
+    workers = os.cpu_count()
+
     i = Indexer(dataset_path, index_file, lookup_table_file, byte_offset_table, debug)
-    i.start()
+    i.start(workers)
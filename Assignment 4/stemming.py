@@ -0,0 +1,84 @@
+from collections import OrderedDict
+import json
+import os
+
+# Default number of words remembered, a few MB of memory.
+STEM_CACHE_SIZE = 100000
+
+# Name of the file the indexer saves its cache to, next to the index, and the search loads it from.
+STEM_FILE = "stems.json"
+
+
+class StemCache:
+    # Remembers the stems of the most recently used words, so each common word is only stemmed once.
+    # Shared by the indexer and the search, which must stem words the same way.
+    def __init__(self, stemmer, size=STEM_CACHE_SIZE):
+        self.stemmer = stemmer
+        self.size = size
+
+        # { word::str -> stem::str } least recently used first.
+        self.stems = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+        # Words stemmed since the last call to export and still remembered, used as an ordered set.
+        self.fresh = dict()
+
+    def stem(self, word):
+        stem = self.stems.get(word)
+        if stem is not None:
+            self.hits += 1
+            self.stems.move_to_end(word)
+            return stem
+
+        self.misses += 1
+        stem = self.stems[word] = self.stemmer.stem(word)
+        self.fresh[word] = None
+
+        # Forget the least recently used word.
+        if len(self.stems) > self.size:
+            word, _ = self.stems.popitem(last=False)
+            self.fresh.pop(word, None)
+        return stem
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        return "{} words, {} hits, {} misses, {:.1%} hit rate".format(len(self.stems), self.hits, self.misses, self.hit_rate())
+
+    def export(self):
+        # The counts and new stems since the last export, for a worker process to send to the process that saves the cache.
+        # Returns ( hits::int, misses::int, [ ( word::str, stem::str ) ] )
+        update = (self.hits, self.misses, [(word, self.stems[word]) for word in self.fresh])
+        self.hits = 0
+        self.misses = 0
+        self.fresh = dict()
+        return update
+
+    def merge(self, update):
+        hits, misses, stems = update
+        self.hits += hits
+        self.misses += misses
+        for word, stem in stems:
+            self.stems[word] = stem
+            self.stems.move_to_end(word)
+        while len(self.stems) > self.size:
+            self.stems.popitem(last=False)
+
+    def save(self, path):
+        # Written to a temporary file first so a reader never sees half a cache.
+        with open(path + ".tmp", "w") as f:
+            json.dump(list(self.stems.items()), f)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path, stemmer, size=STEM_CACHE_SIZE):
+        # A cache warmed with the words saved at path, or an empty one if there is no such file.
+        cache = cls(stemmer, size)
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                cache.stems.update(json.load(f)[-size:])
+        return cache
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The indexer's modules are imported from its folder, as when running indexer.py there.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,74 @@
+import os
+
+import pytest
+
+pytest.importorskip("nltk")
+
+from tokenizer_benchmark import TreebankTokenizer, load_texts
+from tokenizer import NltkTokenizer, RegexTokenizer
+
+# Pages in the format of the DEV dataset, reduced to their text the way the indexer does it.
+PAGES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pages")
+
+
+def punkt_installed():
+    from nltk.tokenize import word_tokenize
+    try:
+        word_tokenize("Punkt is installed.")
+    except LookupError:
+        return False
+    return True
+
+
+# Tag text whose tokens are not all alphanumeric before stemming.
+CONTRACTIONS = "You'll see we're here, they've left. D'ye know more'n I can't? The students' lab 're-opens at 10:30."
+
+
+@pytest.fixture(scope="module")
+def texts():
+    return load_texts(PAGES, None)
+
+
+def stems(tokenizer, text):
+    # Tag text the way the indexer weights it: every token stemmed, then only the alphanumeric stems kept.
+    from nltk.stem.snowball import SnowballStemmer
+    stemmer = SnowballStemmer(language="english")
+    return [stem for stem in (stemmer.stem(word.lower()) for word in tokenizer.words(text)) if stem.isalnum()]
+
+
+def test_pages_loaded(texts):
+    assert len(texts) == len(os.listdir(PAGES))
+    assert all(texts)
+
+
+def test_regex_matches_treebank(texts):
+    # Runs without the punkt model: every rule but Punkt's sentence splitting.
+    reference = TreebankTokenizer()
+    candidate = RegexTokenizer()
+    for text in texts:
+        assert list(candidate.tokens(text)) == list(reference.tokens(text))
+
+
+def test_regex_stems_match_treebank(texts):
+    reference = TreebankTokenizer()
+    candidate = RegexTokenizer()
+    assert {"ll", "re", "ve", "ye"} <= set(stems(reference, CONTRACTIONS))
+    for text in texts + [CONTRACTIONS]:
+        assert stems(candidate, text) == stems(reference, text)
+
+
+@pytest.mark.skipif(not punkt_installed(), reason="nltk's punkt model is not installed")
+def test_regex_matches_nltk(texts):
+    # The check RegexTokenizer has to pass before it can replace nltk as the default TOKENIZER.
+    reference = NltkTokenizer()
+    candidate = RegexTokenizer()
+    for text in texts + [CONTRACTIONS]:
+        assert list(candidate.tokens(text)) == list(reference.tokens(text))
+        assert stems(candidate, text) == stems(reference, text)
+
+
+@pytest.mark.skipif(not punkt_installed(), reason="nltk's punkt model is not installed")
+@pytest.mark.xfail(reason="a period before whitespace always ends a sentence for RegexTokenizer, not for Punkt")
+def test_abbreviations():
+    text = "Office hours with Dr. Smith are on Mon. and Wed. afternoons."
+    assert list(RegexTokenizer().tokens(text)) == list(NltkTokenizer().tokens(text))
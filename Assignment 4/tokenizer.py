@@ -0,0 +1,128 @@
+import re
+
+# Name of the tokenizer the indexer and the search use unless told otherwise. RegexTokenizer is faster but stays
+# opt-in until tests/test_tokenizer.py passes against nltk with its punkt model installed.
+TOKENIZER = "nltk"
+
+# A run of text nltk's word tokenizer keeps together as one token. It is ended by whitespace and by everything the
+# tokenizer always splits off: quotes, brackets, ; @ # $ % & ? ! *, dashes, "--", "''", runs of periods and an opening
+# apostrophe, one after a non-word character and before a word that is not a contraction such as 're or 's.
+# A comma or colon only stays inside a token when a digit follows, as in 3,000 or 10:30, or when it is the second of
+# a pair such as ::, which nltk leaves stuck to the next token. The same goes for the third dash of ---.
+CHUNK = re.compile(
+    r"(?:[^\s«“‘„`»”’\"';@#$%&\u2012-\u2015?!*\[\]{}()<>:,.\-]|(?<!-)-(?!-)|(?<=(?<!-)--)-(?!-)|(?<!\.)\.(?!\.)"
+    r"|(?<!')(?!(?<!\w)'(?!(?i:re|ve|ll|m|t|s|d|n)\b)\w)'(?!')|[:,](?=\d)|(?<=(?<![:,])[:,])[:,])+")
+
+# The period ending a sentence, possibly followed by closing apostrophes.
+PERIOD = re.compile(r"(?<=[^.])\.(?='*$)")
+
+# What may follow a period ending a sentence: closing quotes or brackets, then whitespace or the end of the text.
+SENTENCE_END = re.compile(r"[\"')\]}>»”’]*(?:\s|$)")
+
+# A word followed by a closing apostrophe, then by 's, 'm or 'd, then by 'll, 're, 've or n't. nltk splits these off
+# into tokens of their own, in that order, so "can't's' " becomes ca n't 's '. The first only happens when whitespace
+# or punctuation nltk separates early on comes next.
+QUOTE = re.compile(r"^(.*[^'])(')$")
+QUOTE_END = re.compile(r"[\s;@#$%&?!,:.«“‘„`\u2012-\u2015]")
+CLOSING = re.compile(r"^(.*[^'])('[sSmMdD]|')$")
+CONTRACTION = re.compile(r"^(.*[^'])('ll|'LL|'re|'RE|'ve|'VE|n't|N'T)$")
+
+# { word::str -> length of its first part::int } words nltk splits in two, such as cannot -> can not.
+SPLIT_WORDS = {"cannot": 3, "gimme": 3, "gonna": 3, "gotta": 3, "lemme": 3, "wanna": 3}
+
+# The same words, and d'ye and more'n, inside a token with punctuation in it, such as -cannot.
+SPLIT_INSIDE = re.compile(
+    r"(?i)\b(can)(not)\b|\b(d)('ye)\b|\b(gim)(me)\b|\b(gon)(na)\b|\b(got)(ta)\b|\b(lem)(me)\b|\b(more)('n)\b"
+    r"|\b(wan)(na)(?=\s|$)")
+
+
+class RegexTokenizer:
+    # Yields the alphanumeric tokens nltk's word_tokenize would, without running it: one precompiled regex finds the
+    # runs of text it would keep together, and only runs with punctuation in them need a closer look.
+    # nltk lets Punkt decide where sentences end, and only a sentence's last period is split off the word before it.
+    # This treats every period before whitespace as the end of a sentence, so it also keeps "dr" from "Dr. Smith",
+    # which nltk drops as "Dr.". tokenizer_benchmark.py measures how often the two disagree.
+    name = "regex"
+
+    def tokens(self, text):
+        return self.find_tokens(text, False)
+
+    def words(self, text):
+        # Also the tokens that are not alphanumeric and the suffixes split off words, such as 'll. The indexer stems tag
+        # text before it drops those, and 'll, 're, 've and 'ye stem to alphanumeric words.
+        return self.find_tokens(text, True)
+
+    def find_tokens(self, text, words):
+        for match in CHUNK.finditer(text):
+            chunk = match.group()
+            suffixes = ()
+
+            if not chunk.isalnum():
+                suffixes = []
+                if chunk.endswith(".") or chunk.endswith("'"):
+                    if SENTENCE_END.match(text, match.end()):
+                        chunk = PERIOD.sub("", chunk, count=1)
+                if chunk.endswith("'") and QUOTE_END.match(text, match.end()):
+                    chunk = QUOTE.sub(r"\1", chunk)
+                for suffix in (CLOSING, CONTRACTION):
+                    split = suffix.match(chunk)
+                    if split:
+                        chunk = split.group(1)
+                        suffixes.append(split.group(2))
+                if not chunk.isalnum():
+                    for piece in SPLIT_INSIDE.sub(lambda split: " " + " ".join(filter(None, split.groups())) + " ", chunk).split():
+                        if words or piece.isalnum():
+                            yield piece
+                    chunk = None
+
+            if chunk is None:
+                pass
+            elif len(chunk) in (5, 6) and chunk.lower() in SPLIT_WORDS:
+                split = SPLIT_WORDS[chunk.lower()]
+                yield chunk[:split]
+                yield chunk[split:]
+            else:
+                yield chunk
+
+            if words:
+                # In the order nltk splits them off, the last one removed first.
+                yield from reversed(suffixes)
+
+
+class NltkTokenizer:
+    # nltk's word_tokenize, keeping only the alphanumeric tokens. Every text goes through Punkt sentence splitting and
+    # the Treebank regular expressions first, which makes it several times slower than RegexTokenizer.
+    name = "nltk"
+
+    def __init__(self):
+        # Imported here so nltk's punkt model is only looked for, and downloaded if missing, when this tokenizer is used.
+        import nltk
+        from nltk.tokenize import word_tokenize
+
+        # Newer versions of nltk load punkt_tab instead of punkt.
+        for model in ("punkt", "punkt_tab"):
+            try:
+                nltk.data.find("tokenizers/" + model)
+            except LookupError:
+                nltk.download(model)
+        self.word_tokenize = word_tokenize
+
+    def tokens(self, text):
+        for token in self.word_tokenize(text):
+            if token.isalnum():
+                yield token
+
+    def words(self, text):
+        return self.word_tokenize(text)
+
+
+TOKENIZERS = {
+    "regex": RegexTokenizer,
+    "nltk": NltkTokenizer,
+}
+
+
+def get_tokenizer(name=TOKENIZER):
+    if name not in TOKENIZERS:
+        raise ValueError("Unknown tokenizer {}, choose one of {}.".format(name, ", ".join(TOKENIZERS)))
+    return TOKENIZERS[name]()
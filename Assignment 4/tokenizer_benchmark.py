@@ -0,0 +1,102 @@
+''' Checks the regex tokenizer against nltk's word_tokenize on the pages of a
+dataset, and measures how many tokens per second each of them produces.
+
+    python tokenizer_benchmark.py DEV --files 2000
+
+Each page is reduced to its text the way the indexer does it. The report
+gives the share of pages that get exactly the same alphanumeric tokens from
+both, and the tokens found by only one of them most often.
+
+nltk needs its punkt model. Without network access to download it, pass
+--no-punkt: the reference then splits sentences at . ! or ? followed by
+whitespace and runs nltk's Treebank word tokenizer on each one. That checks
+every rule but Punkt's abbreviations.
+'''
+from collections import Counter
+from bs4 import BeautifulSoup
+import argparse
+import json
+import os
+import re
+import time
+
+from indexer import Indexer
+from tokenizer import NltkTokenizer, RegexTokenizer
+
+
+class TreebankTokenizer:
+    # The reference used with --no-punkt.
+    name = "treebank"
+
+    def __init__(self):
+        from nltk.tokenize import NLTKWordTokenizer
+        self.treebank = NLTKWordTokenizer()
+        self.sentences = re.compile(r"(?<=[.!?])[\"')\]}»”’]*\s+")
+
+    def tokens(self, text):
+        for token in self.words(text):
+            if token.isalnum():
+                yield token
+
+    def words(self, text):
+        for sentence in self.sentences.split(text):
+            yield from self.treebank.tokenize(sentence)
+
+
+def load_texts(dataset_path, files):
+    # Only used to extract the text, the tokenizer does not matter.
+    indexer = Indexer(None, None, None, None, False, tokenizer="regex")
+    texts = []
+    for subdir, dirs, names in os.walk(dataset_path):
+        for name in names:
+            if len(texts) == files:
+                return texts
+            with open(os.path.join(subdir, name), "r") as f:
+                content = json.load(f)["content"]
+            text, tag_text = indexer.extract(BeautifulSoup(content, "html.parser"))
+            texts.append(text)
+    return texts
+
+
+def conformance(reference, candidate, texts):
+    same = 0
+    # { token::str -> times it was found by only one of the tokenizers::int }
+    missing = Counter()
+    extra = Counter()
+    for text in texts:
+        expected = list(reference.tokens(text))
+        found = list(candidate.tokens(text))
+        if expected == found:
+            same += 1
+            continue
+        expected = Counter(expected)
+        found = Counter(found)
+        missing.update(expected - found)
+        extra.update(found - expected)
+
+    print("{} of {} pages ({:.2%}) tokenized identically.".format(same, len(texts), same / len(texts) if texts else 1))
+    print("Only from {}: {} tokens, most often {}".format(reference.name, sum(missing.values()), missing.most_common(10)))
+    print("Only from {}: {} tokens, most often {}".format(candidate.name, sum(extra.values()), extra.most_common(10)))
+
+
+def throughput(tokenizer, texts):
+    start = time.perf_counter()
+    tokens = sum(1 for text in texts for token in tokenizer.tokens(text))
+    seconds = time.perf_counter() - start
+    print("{}: {} tokens in {:.2f} s, {:.0f} tokens/s".format(tokenizer.name, tokens, seconds, tokens / seconds if seconds else 0))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("dataset_path", nargs="?", default="DEV")
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--no-punkt", action="store_true")
+    args = parser.parse_args()
+
+    texts = load_texts(args.dataset_path, args.files)
+    reference = TreebankTokenizer() if args.no_punkt else NltkTokenizer()
+    candidate = RegexTokenizer()
+
+    conformance(reference, candidate, texts)
+    for tokenizer in (reference, candidate):
+        throughput(tokenizer, texts)